@@ -0,0 +1,231 @@
+# Standard Libraries
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+ANALYTICS_LOG_NAME = "colormusic-analytics-log"
+
+# Sink for analytics events: "cloud" (Cloud Logging), "stdout" or "jsonl" (file at ANALYTICS_JSONL_PATH)
+ANALYTICS_SINK = os.getenv("ANALYTICS_SINK", "cloud")
+ANALYTICS_JSONL_PATH = os.getenv("ANALYTICS_JSONL_PATH", "analytics.jsonl")
+
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", 10000))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", 100))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 2.0))  # Seconds
+ANALYTICS_DRAIN_TIMEOUT = 10.0  # Seconds
+
+
+def create_cloud_logger():
+    """Create the Cloud Logging logger, imported here so local sinks never need google-cloud-logging.
+
+    Uses the COLORMUSIC_SA_KEY service account if set (frontend), otherwise the default credentials.
+    """
+    from google.cloud import logging
+
+    sa_key_path = os.getenv("COLORMUSIC_SA_KEY")
+    client = logging.Client.from_service_account_json(sa_key_path) if sa_key_path else logging.Client()
+
+    return client.logger(ANALYTICS_LOG_NAME)
+
+
+# ====== Sinks ======
+class CloudLoggingSink:
+    """Ship batches to Cloud Logging with a single write request per batch"""
+    def __init__(self, logger_factory=create_cloud_logger):
+        self.logger_factory = logger_factory
+        self.logger = None
+
+    def write(self, entries):
+        if self.logger is None:
+            self.logger = self.logger_factory()
+
+        batch = self.logger.batch()
+        for entry in entries:
+            batch.log_struct(entry["payload"], severity=entry["severity"])
+        batch.commit()
+
+    def close(self):
+        pass
+
+
+class StdoutSink:
+    """Print one JSON line per event, for local runs"""
+    def write(self, entries):
+        for entry in entries:
+            print(json.dumps({"severity": entry["severity"], **entry["payload"]}, default=str), file=sys.stdout)
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+
+class JsonlFileSink:
+    """Append one JSON line per event to a file, for local runs and load tests"""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, entries):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+
+        for entry in entries:
+            self.file.write(json.dumps({"severity": entry["severity"], **entry["payload"]}, default=str) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def create_sink(sink_name=None):
+    """Create the sink named by ANALYTICS_SINK"""
+    sink_name = sink_name or ANALYTICS_SINK
+
+    if sink_name == "cloud":
+        return CloudLoggingSink()
+    elif sink_name == "stdout":
+        return StdoutSink()
+    elif sink_name == "jsonl":
+        return JsonlFileSink(ANALYTICS_JSONL_PATH)
+
+    raise ValueError(f"Unknown analytics sink: {sink_name}")
+
+
+# ====== Shipper ======
+class AnalyticsShipper:
+    """Background thread shipping analytics events in batches, so logging never blocks a request.
+
+    Events go on a bounded queue (dropped and counted when full) and are flushed to the sink every
+    batch_size events or flush_interval seconds, whichever comes first.
+    """
+    def __init__(self, sink, max_queue_size=ANALYTICS_QUEUE_SIZE, batch_size=ANALYTICS_BATCH_SIZE,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.dropped = 0
+        self.shipped = 0
+        self.failed = 0
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()  # Counters are updated from request threads and the shipper thread
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="analytics-shipper", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, payload, severity="INFO"):
+        if self._thread is None:
+            self.start()
+
+        try:
+            self.queue.put_nowait({"payload": payload, "severity": severity})
+        except queue.Full:
+            self._count("dropped", 1)
+
+    def _count(self, counter, amount):
+        with self._counts_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self):
+        with self._counts_lock:
+            return {
+                "queued": self.queue.qsize(),
+                "dropped": self.dropped,
+                "shipped": self.shipped,
+                "failed": self.failed,
+            }
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+
+            if timeout <= 0 or (self._stop.is_set() and self.queue.empty()):
+                break
+
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 0.1) if self._stop.is_set() else timeout))
+            except queue.Empty:
+                continue
+
+        return batch
+
+    def _ship(self, batch):
+        try:
+            self.sink.write(batch)
+            self._count("shipped", len(batch))
+        except Exception as e:
+            # Never let a logging backend failure take the service down, count and move on
+            self._count("failed", len(batch))
+            print(f"Failed to ship {len(batch)} analytics events: {e!r}", file=sys.stderr)
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+
+            if batch:
+                self._ship(batch)
+
+    def shutdown(self, timeout=ANALYTICS_DRAIN_TIMEOUT):
+        """Drain queued events to the sink and stop the thread, once (called from lifespan shutdown and atexit)"""
+        with self._lock:
+            if self._closed:
+                return
+
+            self._closed = True
+
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        self.sink.close()
+
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
+
+def get_shipper():
+    """Get the process wide shipper, created on first use"""
+    global _shipper
+
+    if _shipper is None:
+        with _shipper_lock:
+            if _shipper is None:
+                _shipper = AnalyticsShipper(create_sink())
+                atexit.register(_shipper.shutdown)
+
+    return _shipper
+
+
+def shutdown_analytics():
+    """Drain and stop the shipper (if one was started)"""
+    if _shipper is not None:
+        _shipper.shutdown()
+
+
+def log_analytics_event(event_type, severity="INFO", **kwargs):
+    """Queue a structured analytics event for shipping to the configured sink."""
+    log_entry = {
+        "tag": "colormusic-analytics",
+        "event_type": event_type,
+        **kwargs
+    }
+
+    get_shipper().enqueue(log_entry, severity=severity)
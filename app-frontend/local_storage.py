@@ -0,0 +1,163 @@
+# Standard Libraries
+import os
+import shutil
+import threading
+import time
+
+# Third-party Libraries
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# Generation checks and writes are atomic within a process (local runs are a single service process each)
+_write_lock = threading.Lock()
+
+
+class LocalBlob:
+    """Filesystem stand-in for google.cloud.storage.Blob, covering the calls the services make"""
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.generation = None
+        self.content_type = None
+
+    @property
+    def path(self):
+        """Filesystem path of the object, refusing names that resolve outside the bucket (.., absolute parts)"""
+        bucket_path = os.path.realpath(self.bucket.path)
+        path = os.path.realpath(os.path.join(bucket_path, *self.name.split("/")))
+
+        if os.path.commonpath([bucket_path, path]) != bucket_path or path == bucket_path:
+            raise ValueError(f"Object name {self.name!r} is outside bucket {self.bucket.name}")
+
+        return path
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _check_exists(self):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+    def reload(self):
+        self._check_exists()
+
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.generation = stat.st_mtime_ns
+
+    def _current_generation(self):
+        """Generation (mtime in ns) of the stored object, 0 if there is none, as in GCS preconditions"""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _write(self, write, if_generation_match=None):
+        """Write to a temp file then rename (readers never see a partial object) with a new, increasing generation.
+
+        A write with if_generation_match not matching the stored generation raises PreconditionFailed, like GCS.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp-{os.getpid()}-{id(self)}"
+        with open(tmp_path, "wb") as f:
+            write(f)
+
+        with _write_lock:
+            previous = self._current_generation()
+
+            if if_generation_match is not None and if_generation_match != previous:
+                os.remove(tmp_path)
+                raise PreconditionFailed(f"Generation of {self.bucket.name}/{self.name} is {previous}, "
+                                         f"not {if_generation_match}")
+
+            # mtime can be coarser than back to back writes, keep generations distinct
+            generation = max(time.time_ns(), previous + 1)
+            os.utime(tmp_path, ns=(generation, generation))
+            os.replace(tmp_path, self.path)
+
+        self.generation = generation
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self._write(lambda f: f.write(data), if_generation_match=if_generation_match)
+        self.content_type = content_type
+
+    def upload_from_file(self, file_obj, rewind=False, size=None, content_type=None, if_generation_match=None):
+        if rewind:
+            file_obj.seek(0)
+
+        self._write(lambda f: shutil.copyfileobj(file_obj, f), if_generation_match=if_generation_match)
+        self.content_type = content_type
+
+    def download_as_bytes(self, start=None, end=None):
+        """Bytes of the object, start/end are inclusive offsets like the GCS client (which also sets generation)"""
+        self._check_exists()
+
+        with _write_lock:
+            self.generation = self._current_generation()
+            f = open(self.path, "rb")
+
+        with f:
+            if start is None and end is None:
+                return f.read()
+
+            start = start or 0
+            f.seek(start)
+
+            return f.read() if end is None else f.read(end - start + 1)
+
+    def download_as_text(self, encoding="utf-8"):
+        return self.download_as_bytes().decode(encoding)
+
+    def download_to_file(self, file_obj):
+        file_obj.write(self.download_as_bytes())
+
+    def download_to_filename(self, filename):
+        self._check_exists()
+        shutil.copyfile(self.path, filename)
+
+    def generate_signed_url(self, *args, **kwargs):
+        raise NotImplementedError("Signed URLs are not available with local storage")
+
+
+class LocalBucket:
+    """Filesystem stand-in for google.cloud.storage.Bucket, objects live under root/bucket_name"""
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = self.blob(name)
+
+        if not blob.exists():
+            return None
+
+        blob.reload()
+
+        return blob
+
+    def list_blobs(self, prefix=""):
+        for directory, _, filenames in os.walk(self.path):
+            for filename in sorted(filenames):
+                name = os.path.relpath(os.path.join(directory, filename), self.path).replace(os.sep, "/")
+
+                if name.startswith(prefix) and ".tmp-" not in filename:
+                    blob = self.blob(name)
+                    blob.reload()
+
+                    yield blob
+
+
+class LocalStorageClient:
+    """Filesystem stand-in for google.cloud.storage.Client, for benchmarks and local runs"""
+    def __init__(self, root):
+        self.root = root
+
+    def bucket(self, name):
+        return LocalBucket(self.root, name)
@@ -1,14 +1,16 @@
-from bs4 import BeautifulSoup
 from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, Form, Request, Response, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from google.cloud import logging
-from google.cloud import storage
-import io
+from google.api_core.exceptions import NotFound
+import codecs
+from datetime import timedelta
 import os
 import re
+import threading
+import time
 from slowapi import Limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
@@ -22,21 +24,135 @@ import zipfile
 # For Cloud Run Service
 import json
 import requests
-from google.auth.transport.requests import Request as GoogleRequest
-from google.oauth2 import service_account
-from google.auth import jwt
+from lxml import etree
+
+from analytics import log_analytics_event, shutdown_analytics
+from local_storage import LocalStorageClient
+from metrics import (BYTES_IN, BYTES_OUT, CONVERSION_IN_USE, UPLOADS_IN_PROGRESS, UPLOADS_TOTAL, VEROVIO_TIMEOUTS,
+                     metrics_payload, observe_upload)
+from musicxml_prune import prune_musicxml
+from palettes import DEFAULT_PALETTE, PALETTES, apply_palette
+from preview_cache import PreviewCache, PreviewPage
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, accepts_encoding, static_assets
+from timing import StageTimer, prefix_server_timing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create cloud clients in the background, pages are served meanwhile and first use waits if needed
+    threading.Thread(target=warm_up, name="startup-warm-up", daemon=True).start()
+
+    yield
+
+    # Drain queued analytics events before the instance goes away
+    shutdown_analytics()
 
 
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 
 retry_after = "60"
-rate_limit_per_minute = "3/minute"
+rate_limit_per_minute = os.getenv("RATE_LIMIT_PER_MINUTE", "3/minute")  # Raised for local load tests
 rate_limit_per_day = "20/day"  # TODO Apply after Locals testing
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Max size of an uploaded score, the multipart request body gets a little headroom for form fields/boundaries
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAGIC_SNIFF_BYTES = 8 * 1024
+
+
+def upload_too_large_message():
+    return f"<strong>File is too large.  Max upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.</strong>"
+
+
+class UploadSizeLimitMiddleware:
+    """Reject request bodies over max_body_bytes for a path before they are parsed/spooled.
+
+    Checks Content-Length up front, and counts bytes as they arrive for chunked requests.  Once over the
+    limit the body is cut off and whatever response the app produces is replaced by a 413.
+    """
+    def __init__(self, app, path, max_body_bytes):
+        self.app = app
+        self.path = path
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+
+        too_large_response = HTMLResponse(upload_too_large_message(), status_code=413, headers={"Connection": "close"})
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            return await too_large_response(scope, receive, send)
+
+        received_bytes = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received_bytes, exceeded
+            message = await receive()
+
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+
+                if received_bytes > self.max_body_bytes:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+
+            return message
+
+        async def limited_send(message):
+            if not exceeded:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                await too_large_response({"type": "http"}, receive, send)
+
+        await self.app(scope, limited_receive, limited_send)
+
+
+app.add_middleware(UploadSizeLimitMiddleware, path="/upload", max_body_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+
+static_files = StaticFiles(directory="static")
+
+
+@app.api_route("/static/{asset_path:path}", methods=["GET", "HEAD"], name="static")
+async def static_asset(request: Request, asset_path: str):
+    """Static files minified and precompressed in memory, immutable when requested by fingerprinted name.
+
+    Anything not (yet) built falls back to the files on disk.
+    """
+    asset, immutable = static_assets.get(asset_path)
+
+    if asset is None:
+        return await static_files.get_response(asset_path, request.scope)
+
+    headers = {
+        "ETag": asset.etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+    if asset.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body, content_encoding = asset.negotiate(request.headers.get("accept-encoding", ""))
+
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+
+    # HEAD (CDNs, link checkers) gets the GET headers, including the length of the body it would receive
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+
+    return Response(content=body, media_type=asset.content_type, headers=headers)
+
+
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
 
 # Custom handler
 @app.exception_handler(RateLimitExceeded)
@@ -53,43 +169,91 @@ async def custom_rate_limit_handler(request: Request, exc: RateLimitExceeded):
     )
 
 
-def extract_xml_from_zip(filename, render_id):
-    zip_blob = bucket.blob(f"{render_id}/{filename}")
+# Guard against zip bombs, max size of the score extracted from a .mxl
+MXL_MAX_UNCOMPRESSED_BYTES = int(os.getenv("MXL_MAX_UNCOMPRESSED_BYTES", 50 * 1024 * 1024))
+MXL_CONTAINER_PATH = "META-INF/container.xml"
+MUSICXML_EXTENSIONS = (".xml", ".musicxml", )
 
-    # Download zip content into memory
-    zip_bytes = zip_blob.download_as_bytes()
+# Verovio stamps the converted MEI with the conversion time, dropped so the same file converts to the same bytes
+MEI_APPLICATION_ISODATE_RE = re.compile(r'(<application\b[^>]*?) isodate="[^"]*"')
+
+
+def read_zip_member(zip_file, file_info, max_bytes=None):
+    """Read a zip member, refusing to decompress more than max_bytes (declared sizes can't be trusted)"""
+    if max_bytes is None:
+        max_bytes = MXL_MAX_UNCOMPRESSED_BYTES
+
+    if file_info.file_size > max_bytes:
+        raise ValueError(f"{file_info.filename} is too large once decompressed ({file_info.file_size} bytes).")
+
+    with zip_file.open(file_info) as member:
+        data = member.read(max_bytes + 1)
+
+    if len(data) > max_bytes:
+        raise ValueError(f"{file_info.filename} is too large once decompressed (over {max_bytes} bytes).")
+
+    return data
+
+
+def find_mxl_rootfile(zip_file):
+    """Find the score inside a .mxl, per META-INF/container.xml or else the first top-level .xml/.musicxml"""
+    names = zip_file.namelist()
+
+    if MXL_CONTAINER_PATH in names:
+        container_xml = read_zip_member(zip_file, zip_file.getinfo(MXL_CONTAINER_PATH))
+        parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        container = etree.fromstring(container_xml, parser=parser)
+
+        for rootfile in container.iter("{*}rootfile"):
+            full_path = rootfile.get("full-path")
+            media_type = rootfile.get("media-type", "application/vnd.recordare.musicxml+xml")
+
+            # First rootfile is the score, others are alternate renditions (ex. PDF)
+            if full_path in names and "musicxml" in media_type:
+                return full_path
+
+    for file_info in zip_file.infolist():
+        if file_info.is_dir() or "/" in file_info.filename.rstrip("/"):
+            continue  # skip directories and nested files
+
+        if file_info.filename.lower().endswith(MUSICXML_EXTENSIONS):
+            return file_info.filename
 
-    # Open zip from bytes buffer
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zip_file:
-        for file_info in zip_file.infolist():
-            if file_info.is_dir():
-                continue  # skip directories
-            
-            if '/' not in file_info.filename.rstrip('/'):
-                # Read file content
-                file_data = zip_file.read(file_info.filename)
-                
-                if file_info.filename.lower().endswith(".xml"):
-                    xml_filename = f'{filename.split(".")[0]}.xml'
-                    
-                    # Upload extracted file back to GCS
-                    new_blob = bucket.blob(f"{render_id}/{xml_filename}")
-                    new_blob.upload_from_string(file_data)
-                    
-                    return xml_filename
-                elif file_info.filename.lower().endswith(".musicxml"):
-                    xml_filename = f'{filename.split(".")[0]}.musicxml'
-                    
-                    # Upload extracted file back to GCS
-                    new_blob = bucket.blob(f"{render_id}/{xml_filename}")
-                    new_blob.upload_from_string(file_data)
-                    
-                    return xml_filename
-    
     raise FileNotFoundError("No .xml file found in the ZIP archive.")
 
 
-def generate_svg_results_html(svg_html_parts: list[str], render_id: str) -> str:
+def extract_xml_from_mxl(zip_fileobj):
+    """Extract the MusicXML score from compressed MusicXML (.mxl) in a seekable file object, returns (rootfile, xml_bytes)"""
+    with zipfile.ZipFile(zip_fileobj) as zip_file:
+        rootfile = find_mxl_rootfile(zip_file)
+
+        return rootfile, read_zip_member(zip_file, zip_file.getinfo(rootfile))
+
+
+def parse_svg_multipart(content_type: str, body: bytes) -> list[str]:
+    """Page SVGs from a multipart/mixed render service response, one part per page"""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode("ascii")
+    page_svgs = []
+
+    # Parts sit between the first delimiter and the closing "--boundary--"
+    for part in body.split(b"--" + boundary)[1:-1]:
+        _, _, content = part.partition(b"\r\n\r\n")
+        page_svgs.append(content.removesuffix(b"\r\n").decode("utf-8"))
+
+    return page_svgs
+
+
+def read_render_result(response) -> list[str]:
+    """Preview pages from a successful render service response, multipart or the JSON {"result": [...]}"""
+    content_type = response.headers.get("Content-Type", "")
+
+    if content_type.startswith("multipart/"):
+        return parse_svg_multipart(content_type, response.content)
+
+    return response.json()["result"]
+
+
+def generate_svg_results_html(page_count: int, render_id: str) -> str:
     safe_render_id = quote(render_id, safe='')
 
     html_parts = [
@@ -99,20 +263,34 @@ def generate_svg_results_html(svg_html_parts: list[str], render_id: str) -> str:
         '  </a>',
         '</div>',
         '<br>',
-        '<div style="width: 600px; margin: 0 auto; text-align: center; font-size: 1.5rem;"><strong>Preview (First Page Only)</strong></div>',
+        '<div style="width: 600px; margin: 0 auto; text-align: center; font-size: 1.5rem;"><strong>Preview</strong></div>',
+        '<div style="width: 600px; margin: 0 auto; text-align: center;">',
+        f'  <input id="retitle-input" type="text" maxlength="{MAX_TITLE_LENGTH}" placeholder="New title">',
+        '  <button id="retitle-button" type="button">Change Title</button>',
+        '  <span id="retitle-status"></span>',
+        '</div>',
+        '<div style="width: 600px; margin: 0 auto; text-align: center;">',
+        '  <label for="palette-select">Colors </label>',
+        '  <select id="palette-select">',
+        *[f'    <option value="{palette}">{palette.replace("-", " ").title()}</option>' for palette in PALETTES],
+        '  </select>',
+        '</div>',
         "<br>",
     ]
 
     html_parts.append('<div class="svg-wrapper">')
-    html_parts.append('<div class="svg-document">')
+    # Remaining pages are appended by the viewer script (index.html) from /render/{render_id}/pages as it scrolls
+    html_parts.append(f'<div class="svg-document" id="page-viewer" data-render-id="{safe_render_id}">')
     
-    for svg_html_part in svg_html_parts:
+    for page in range(1, page_count + 1):
         html_parts.append('<div class="svg-page">')
-        html_parts.append(svg_html_part)  # inject inline SVG content
+        # Served (and cached by the browser) separately, not inlined
+        html_parts.append(f'<img src="/render/{safe_render_id}/page/{page}.svg" loading="lazy" alt="Page {page}">')
         html_parts.append('</div>')
 
     html_parts.append('</div>')
     html_parts.append('</div>')
+    html_parts.append('<div id="page-viewer-sentinel"></div>')
 
     return " ".join(html_parts)
 
@@ -147,31 +325,205 @@ async def render_page(request: Request, uploaded: bool = False, svgs: List[str]
     })
 
 
-# Load the service account credentials
+# Storage is GCS ("gcs") or a local directory ("local", offline runs/load tests), shared with the render service
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "/tmp/colormusic-storage")
+BUCKET_NAME = os.getenv("RENDER_BUCKET", "colormusic-notation-tool-render-staging")
+
+# Service account key for GCS and render service ID tokens
 sa_key_path = os.getenv("COLORMUSIC_SA_KEY")
-gcs_client = storage.Client.from_service_account_json(sa_key_path)
-bucket = gcs_client.bucket("colormusic-notation-tool-render-staging")
 
-CLOUD_RUN_URL = "https://colormusic-render-svc-388982170722.us-east1.run.app/render-color-music"
+# Strip unused MusicXML elements before conversion to MEI
+MUSICXML_PRUNE_ENABLED = os.getenv("MUSICXML_PRUNE_ENABLED", "1") == "1"
+
+# PDF downloads are streamed through the frontend ("stream") or redirected to a signed GCS URL ("redirect")
+PDF_DOWNLOAD_MODE = os.getenv("PDF_DOWNLOAD_MODE", "stream")
+PDF_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+PDF_SIGNED_URL_EXPIRATION = timedelta(minutes=15)
+
+# A page URL is immutable for a header revision (?v=, bumped by each title change), browsers can keep it for good
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PREVIEW_STALE_CACHE_CONTROL = "no-cache"
+SVG_OPEN_TAG_RE = re.compile(rb"<svg\b[^>]*>")
+MAX_TITLE_LENGTH = 200
+RENDER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+preview_cache = PreviewCache("preview_svg")
+
+PAGES_DEFAULT_LIMIT = 10
+PAGES_MAX_LIMIT = 50
+
+CLOUD_RUN_URL = os.getenv("RENDER_SERVICE_URL",
+                          "https://colormusic-render-svc-388982170722.us-east1.run.app/render-color-music")
 AUDIENCE = CLOUD_RUN_URL
+RENDER_PDF_URL = os.getenv("RENDER_PDF_URL", f"{CLOUD_RUN_URL.rsplit('/', 1)[0]}/render-pdf")
+RENDER_RETITLE_URL = os.getenv("RENDER_RETITLE_URL", f"{CLOUD_RUN_URL.rsplit('/', 1)[0]}/retitle")
 
-# Create credentials from service account file
-credentials = service_account.IDTokenCredentials.from_service_account_file(
-    sa_key_path,
-    target_audience=AUDIENCE
-)
+# Renders skip the PDF, it is generated on the first /download-pdf (many users only view the pages)
+PDF_ON_DEMAND = os.getenv("PDF_ON_DEMAND", "1") == "1"
 
-logger = logging.Client.from_service_account_json(sa_key_path).logger("colormusic-analytics-log")
+# Render service calls carry a Cloud Run ID token ("id_token"), a locally run service needs none ("none")
+RENDER_SERVICE_AUTH = os.getenv("RENDER_SERVICE_AUTH", "id_token")
 
-def log_analytics_event(event_type, severity="INFO", **kwargs):
-    """Log a structured analytics event to Cloud Logging."""
-    log_entry = {
-        "tag": "colormusic-analytics",
-        "event_type": event_type,
-        **kwargs
-    }
+_bucket = None
+_credentials = None
+_clients_lock = threading.Lock()
+
+
+def get_bucket():
+    """Get the render staging bucket, the storage client is created on first use"""
+    global _bucket
+
+    if _bucket is None:
+        with _clients_lock:
+            if _bucket is None:
+                if STORAGE_BACKEND == "local":
+                    gcs_client = LocalStorageClient(LOCAL_STORAGE_ROOT)
+                else:
+                    from google.cloud import storage
+
+                    gcs_client = storage.Client.from_service_account_json(sa_key_path)
+
+                _bucket = gcs_client.bucket(BUCKET_NAME)
+
+    return _bucket
+
+
+def get_credentials():
+    """Get render service ID token credentials (created from the service account file on first use), None without auth"""
+    global _credentials
+
+    if _credentials is None and RENDER_SERVICE_AUTH == "id_token":
+        with _clients_lock:
+            if _credentials is None:
+                from google.oauth2 import service_account
+
+                _credentials = service_account.IDTokenCredentials.from_service_account_file(
+                    sa_key_path,
+                    target_audience=AUDIENCE
+                )
+
+    return _credentials
+
+
+def render_service_headers():
+    """Headers for render service calls, with an ID token unless RENDER_SERVICE_AUTH is "none" """
+    headers = {}
+    credentials = get_credentials()
+
+    if credentials is not None:
+        from google.auth.transport.requests import Request as GoogleRequest
+
+        credentials.refresh(GoogleRequest())
+        headers["Authorization"] = f"Bearer {credentials.token}"
+
+    return headers
+
+
+def render_service_error(response, default):
+    """Error message of a failed render service response, default if the body isn't JSON (a proxy 429/502 page)"""
+    try:
+        return response.json().get("error") or default
+    except ValueError:
+        return default
+
+
+def warm_up():
+    """Build the static assets and create the storage client and credentials ahead of the first upload"""
+    try:
+        static_assets.build()
+        print(f"Static assets built: {static_assets.bytes_before} -> {static_assets.bytes_after} bytes minified")
+    except Exception:
+        # Served from disk as before
+        print(f"Static asset build failed: {traceback.format_exc()}")
+
+    try:
+        get_bucket()
+        get_credentials()
+    except Exception:
+        # Not fatal here, the first request that needs them retries and reports the error
+        print(f"Warm-up failed: {traceback.format_exc()}")
+
+
+def load_render_manifest(render_id: str):
+    """Load the manifest written by the render service for render_id, None if not present"""
+    blob = get_bucket().blob(f"{render_id}/manifest.json")
+
+    try:
+        return json.loads(blob.download_as_text(encoding="utf-8"))
+    except NotFound:
+        return None
+
+
+def find_manifest_artifact(manifest, kind: str, page: int = None):
+    """Find an artifact entry in a render manifest by kind (and page, if applicable)"""
+    for artifact in manifest.get("artifacts", []):
+        if artifact["kind"] == kind and (page is None or artifact["page"] == page):
+            return artifact
+
+    return None
+
+
+def sniff_input_format(head: bytes):
+    """Detect input format from the leading bytes of an upload.
+
+    Returns "musicxml_compressed", "mei", "musicxml", "xml" (XML with an unrecognised root) or None.
+    """
+    if head.startswith(b"PK\x03\x04"):
+        return "musicxml_compressed"
+
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = head.decode("utf-16", errors="ignore")
+    else:
+        text = head.decode("utf-8-sig", errors="ignore")
+
+    if not text.lstrip().startswith("<"):
+        return None
+
+    if re.search(r"<mei[\s>]", text):
+        return "mei"
+    elif re.search(r"<score-(partwise|timewise)[\s>]", text):
+        return "musicxml"
+
+    return "xml"
+
+
+def resolve_input_format(extension_format: str, sniffed_format: str):
+    """Reconcile the extension based format with the sniffed one, None if they conflict"""
+    if sniffed_format is None:
+        return None
+
+    if "musicxml_compressed" in [extension_format, sniffed_format, ]:
+        return extension_format if extension_format == sniffed_format else None
+
+    if sniffed_format == "xml":
+        return extension_format
+
+    # Content wins over extension for MEI vs MusicXML
+    return sniffed_format
+
+
+async def spool_upload(file: UploadFile):
+    """Measure an upload chunk by chunk against MAX_UPLOAD_BYTES, returns (size, head) or None if too large.
+
+    The multipart body is already spooled to a temp file by the parser, this only reads it in bounded chunks.
+    """
+    size = 0
+    head = b""
+
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        if not head:
+            head = chunk[:MAGIC_SNIFF_BYTES]
+
+        size += len(chunk)
+
+        if size > MAX_UPLOAD_BYTES:
+            return None
+
+    await file.seek(0)
+
+    return size, head
 
-    logger.log_struct(log_entry, severity=severity)
 
 def gcs_friendly_filename(filename: str) -> str:
     # Normalize Unicode characters to ASCII (remove accents)
@@ -189,15 +541,17 @@ def gcs_friendly_filename(filename: str) -> str:
 def verovio_job(xml):
     from verovio import toolkit
     tk = toolkit()
+    tk.setOptions({"xmlIdChecksum": True})  # Same file, same MEI ids
     tk.loadData(xml)
-    return tk.getMEI()
+    return MEI_APPLICATION_ISODATE_RE.sub(r"\1", tk.getMEI(), count=1)
 
 def get_mei_safely(xml_content, timeout=10):
-    with ProcessPoolExecutor(max_workers=1) as executor:
+    with CONVERSION_IN_USE.track_inprogress(), ProcessPoolExecutor(max_workers=1) as executor:
         future = executor.submit(verovio_job, xml_content)
         try:
             return future.result(timeout=timeout)
         except TimeoutError:
+            VEROVIO_TIMEOUTS.inc()
             raise RuntimeError("Verovio timed out")
 
 
@@ -207,6 +561,14 @@ def healthz():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics"""
+    body, content_type = metrics_payload()
+
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/start-render")
 def start_render():
     render_id = str(uuid.uuid4())
@@ -216,7 +578,29 @@ def start_render():
 @app.post("/upload")
 @limiter.limit(rate_limit_per_minute)
 async def upload(request: Request, response: Response, file: UploadFile = File(...), title: str = Form(...), render_id: str = Form(...)):
-    content = await file.read()
+    # render_id becomes the storage prefix, so it must not be able to name another path
+    if not RENDER_ID_PATTERN.match(render_id):
+        UPLOADS_TOTAL.labels(outcome="rejected").inc()
+        return HTMLResponse("<strong>Invalid render id.</strong>", status_code=400)
+
+    with UPLOADS_IN_PROGRESS.track_inprogress():
+        return await process_upload(file, title, render_id)
+
+
+async def process_upload(file: UploadFile, title: str, render_id: str):
+    """Convert (if applicable) and store an uploaded score, then render it via the render service"""
+    timer = StageTimer()
+    started = time.perf_counter()
+
+    with timer.span("spool"):
+        spooled = await spool_upload(file)
+
+    if spooled is None:
+        UPLOADS_TOTAL.labels(outcome="rejected").inc()
+        return HTMLResponse(upload_too_large_message(), status_code=413)
+
+    upload_size, head = spooled
+    BYTES_IN.inc(upload_size)
     filename = file.filename
     
     # TODO make the filename GCS friendly
@@ -234,19 +618,32 @@ async def upload(request: Request, response: Response, file: UploadFile = File(.
     elif file_extension in ["musicxml", "xml"]:
         input_format = "musicxml"
     else:
+        UPLOADS_TOTAL.labels(outcome="rejected").inc()
         return HTMLResponse("<div>Unable to determine file type based on extension ...</div>")
 
+    input_format = resolve_input_format(input_format, sniff_input_format(head))
+
+    if input_format is None:
+        UPLOADS_TOTAL.labels(outcome="rejected").inc()
+        return HTMLResponse("<div>File contents do not match a supported score format (MusicXML, compressed MusicXML or MEI) ...</div>")
+
+    bucket = get_bucket()
     blob = bucket.blob(f"{render_id}/{filename}")
     
-    # Save file to GCS
-    blob.upload_from_string(content)
+    # Save file to GCS, streamed from the spooled upload
+    with timer.span("storage_upload"):
+        blob.upload_from_file(file.file, size=upload_size, rewind=True)
     
+    xml_bytes = None
+
     try:
         if input_format == "musicxml_compressed":
-            
-            filename = extract_xml_from_zip(filename, render_id)
-            print(f"GCS Extract File: {filename}")
+            with timer.span("mxl_extract"):
+                rootfile, xml_bytes = extract_xml_from_mxl(file.file)
+            print(f"MXL Rootfile: {rootfile}")
     except:
+        UPLOADS_TOTAL.labels(outcome="error").inc()
+
         log_analytics_event(
             event_type="render_error", 
             severity="ERROR", 
@@ -260,23 +657,31 @@ async def upload(request: Request, response: Response, file: UploadFile = File(.
 
     try:
         if input_format in ["musicxml", "musicxml_compressed", ]:
-            blob = bucket.blob(f"{render_id}/{filename}")
-
-            # Download XML content as string
-            xml_content = blob.download_as_text(encoding="utf-8")
-
-            # soup = BeautifulSoup(xml_content, "lxml-xml")
-            
-            # print(f"Length of xml content: {len(xml_content)}")
-            # print("Removing harmony blocks ...")
-            # # Remove unsupported harmony blocks (chord diagrams)
-            # for harmony in soup.find_all("harmony"):
-            #     harmony.decompose()
-            
-            # xml_content = str(soup)
+            if xml_bytes is None:
+                file.file.seek(0)
+                xml_bytes = file.file.read()
+
+            if MUSICXML_PRUNE_ENABLED:
+                try:
+                    # Drop elements not used in ColorMusic output (ex. harmony/chord diagrams), speeds up conversion
+                    with timer.span("musicxml_prune"):
+                        xml_bytes, prune_stats = prune_musicxml(xml_bytes)
+
+                    log_analytics_event(
+                        event_type="musicxml_pruned",
+                        render_id=render_id,
+                        filename=filename,
+                        **prune_stats
+                    )
+                except etree.XMLSyntaxError:
+                    # Leave malformed input as is, conversion will report on it
+                    print(f"Unable to prune MusicXML: {traceback.format_exc()}")
+
+            xml_content = xml_bytes.decode("utf-8")
 
             print(f"Length of xml content: {len(xml_content)}")
-            mei_data = get_mei_safely(xml_content)
+            with timer.span("convert_mei"):
+                mei_data = get_mei_safely(xml_content)
             
             if not mei_data:
                 raise Exception("Conversion from MusicXML file to MEI was not successful; empty MEI file.  Verify input file is the correct type (ex. MusicXML, not MuseScore XML)")
@@ -285,8 +690,11 @@ async def upload(request: Request, response: Response, file: UploadFile = File(.
             blob = bucket.blob(f"{render_id}/{filename}")
 
             # Save .mei file to GCS
-            blob.upload_from_string(mei_data)
+            with timer.span("storage_upload"):
+                blob.upload_from_string(mei_data)
     except Exception as e:
+        UPLOADS_TOTAL.labels(outcome="error").inc()
+
         log_analytics_event(
             event_type="render_error", 
             severity="ERROR", 
@@ -298,42 +706,382 @@ async def upload(request: Request, response: Response, file: UploadFile = File(.
 
         return HTMLResponse(f"<strong>Error occurred trying to convert MusicXML file to MEI.  <br><br>Error Message: {str(e)}.  <br><br>Error event has been captured for render id: {render_id}.</strong>")
 
-    # Call Render Service
-    credentials.refresh(GoogleRequest())
+    # Call Render Service, preferring raw SVG parts (gzipped on the wire) over JSON wrapped markup
+    headers = render_service_headers()
+    headers["Accept"] = "multipart/mixed, application/json;q=0.5"
 
-    headers = {"Authorization": f"Bearer {credentials.token}"}
     payload = {"filename": filename,
             "title": title,
             "bucket_name": bucket.name,
-            "render_id": render_id, }
-
-    response = requests.post(CLOUD_RUN_URL, json=payload, headers=headers)
+            "render_id": render_id,
+            "generate_pdf": not PDF_ON_DEMAND, }
+
+    with timer.span("render_service"):
+        response = requests.post(CLOUD_RUN_URL, json=payload, headers=headers)
+
+    log_analytics_event(
+        event_type="upload_complete",
+        render_id=render_id,
+        title=title,
+        filename=filename,
+        upload_bytes=upload_size,
+        input_format=input_format,
+        stages=timer.summary(),
+    )
 
     if response.ok:
-        svg_html_parts = response.json()["result"]
+        UPLOADS_TOTAL.labels(outcome="success").inc()
+        observe_upload(timer, input_format, time.perf_counter() - started)
+
+        svg_html_parts = read_render_result(response)
+
+        if response.headers.get("Content-Type", "").startswith("multipart/"):
+            # Raw page SVGs, the browser fetches them right after this response
+            for page, svg_markup in enumerate(svg_html_parts, start=1):
+                preview_cache.put((render_id, page, 0), PreviewPage(svg_markup.encode("utf-8")))
+
+        # Frontend stages plus the render service's own breakdown, visible in browser dev tools
+        server_timing = ", ".join(filter(None, [
+            timer.server_timing(),
+            prefix_server_timing(response.headers.get("Server-Timing"), "render-"),
+        ]))
         
-        return HTMLResponse(generate_svg_results_html(svg_html_parts, render_id))
+        return HTMLResponse(generate_svg_results_html(len(svg_html_parts), render_id), headers={"Server-Timing": server_timing})
     else:
-        return HTMLResponse(f"<strong>{response.json()['error']}</strong>")
+        UPLOADS_TOTAL.labels(outcome="error").inc()
+        return HTMLResponse(f"<strong>{render_service_error(response, 'Unable to process file.')}</strong>")
     
 
-@app.get("/download-pdf")
-def download_pdf(render_id: str):
-    blobs = bucket.list_blobs(prefix=f"{render_id}/")
+def check_palette(palette: str):
+    if palette not in PALETTES:
+        raise HTTPException(status_code=400, detail=f"Unknown palette, expected one of {', '.join(PALETTES)}")
+
+
+def preview_page_url(safe_render_id: str, page: int, palette: str = DEFAULT_PALETTE, revision: int = 0):
+    query = "&".join(filter(None, [
+        f"v={revision}" if revision else None,
+        f"palette={quote(palette, safe='')}" if palette != DEFAULT_PALETTE else None,
+    ]))
+
+    return f"/render/{safe_render_id}/page/{page}.svg{'?' if query else ''}{query}"
+
+
+@app.get("/render/{render_id}/pages")
+def render_pages(render_id: str, offset: int = 0, limit: int = PAGES_DEFAULT_LIMIT, palette: str = DEFAULT_PALETTE):
+    """Page metadata for a render, offset/limit over pages in order, for the paged viewer"""
+    check_palette(palette)
+
+    manifest = load_render_manifest(render_id) if RENDER_ID_PATTERN.match(render_id) else None
+
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Render not found!")
+
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), PAGES_MAX_LIMIT)
+    safe_render_id = quote(render_id, safe='')
+
+    pages = sorted((artifact for artifact in manifest.get("artifacts", []) if artifact["kind"] == "colormusic_svg"),
+                   key=lambda artifact: artifact["page"])
+
+    return {
+        "render_id": render_id,
+        "title": manifest.get("title"),
+        "page_count": len(pages),
+        "offset": offset,
+        "limit": limit,
+        "pages": [
+            {
+                "page": artifact["page"],
+                # Pages are served composed with their header, the URL's revision identifies the bytes
+                "url": preview_page_url(safe_render_id, artifact["page"], palette, header_revision(manifest)),
+            }
+            for artifact in pages[offset:offset + limit]
+        ],
+        "pdf_url": f"/download-pdf?render_id={safe_render_id}",
+    }
+
+
+def header_revision(manifest) -> int:
+    """Header revision of a render, bumped by each title change (0 for renders without header overlays)"""
+    return manifest.get("header", {}).get("revision", 0)
+
+
+def compose_page(body_svg: bytes, header_svg: bytes) -> bytes:
+    """Page SVG with its header overlay, the header's elements placed first inside the page's root <svg>"""
+    header_start = SVG_OPEN_TAG_RE.search(header_svg).end()
+    body_start = SVG_OPEN_TAG_RE.search(body_svg).end()
+
+    return body_svg[:body_start] + header_svg[header_start:header_svg.rindex(b"</svg>")] + body_svg[body_start:]
+
+
+def load_preview_page(render_id: str, page: int, revision: int = 0):
+    """A rendered ColorMusic page with its header, from the preview cache or else storage (via the manifest).
+
+    Returns (page, revision), page None if not found.  Pages are cached per header revision, a revision that
+    isn't cached loads the current one.
+    """
+    preview = preview_cache.get((render_id, page, revision))
+
+    if preview is not None:
+        return preview, revision
+
+    bucket = get_bucket()
+    manifest = load_render_manifest(render_id)
+    sha256 = None
+    header_blob = None
+
+    if manifest is not None:
+        revision = header_revision(manifest)
+        artifact = find_manifest_artifact(manifest, "colormusic_svg", page)
+
+        if artifact is None:
+            return None, revision
+
+        blob = bucket.blob(artifact["name"])
+        header = find_manifest_artifact(manifest, "colormusic_header", page)
+
+        if header is not None:
+            header_blob = bucket.blob(header["name"])
+        else:
+            # Renders that predate header overlays, the stored page is served as is
+            sha256 = artifact["sha256"]
+    else:
+        # Renders that predate the manifest
+        revision = 0
+        suffix = f"-{page}-colormusic.svg"
+        blob = next((blob for blob in bucket.list_blobs(prefix=f"{render_id}/") if blob.name.endswith(suffix)), None)
+
+        if blob is None:
+            return None, revision
+
+    try:
+        body = blob.download_as_bytes()
+
+        if header_blob is not None:
+            body = compose_page(body, header_blob.download_as_bytes())
+    except NotFound:
+        return None, revision
+
+    preview = PreviewPage(body, sha256=sha256)
+    preview_cache.put((render_id, page, revision), preview)
+
+    return preview, revision
+
+
+def load_palette_page(render_id: str, page: int, palette: str, revision: int = 0):
+    """A rendered page recoloured with another palette (its palette <style> swapped), cached like the page itself"""
+    if palette == DEFAULT_PALETTE:
+        return load_preview_page(render_id, page, revision)
+
+    preview = preview_cache.get((render_id, page, revision, palette))
+
+    if preview is not None:
+        return preview, revision
+
+    original, revision = load_preview_page(render_id, page, revision)
+
+    if original is None:
+        return None, revision
+
+    preview = PreviewPage(apply_palette(original.body, palette))
+    preview_cache.put((render_id, page, revision, palette), preview)
+
+    return preview, revision
+
 
-    for blob in blobs:
+@app.get("/render/{render_id}/page/{page}.svg")
+def preview_page(request: Request, render_id: str, page: int, palette: str = DEFAULT_PALETTE, v: int = 0):
+    """A rendered ColorMusic page in a palette at header revision v, with a strong ETag, immutable caching and gzip"""
+    check_palette(palette)
+
+    preview, revision = None, v
+
+    if RENDER_ID_PATTERN.match(render_id):
+        preview, revision = load_palette_page(render_id, page, palette, v)
+
+    if preview is None:
+        raise HTTPException(status_code=404, detail="Page not found!")
+
+    headers = {
+        "ETag": preview.etag,
+        # An outdated revision gets the current page, which must not be kept under that URL
+        "Cache-Control": PREVIEW_CACHE_CONTROL if revision == v else PREVIEW_STALE_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+    if preview.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body = preview.body
+
+    if accepts_encoding(request.headers.get("accept-encoding", ""), "gzip"):
+        body = preview.gzip_body
+        headers["Content-Encoding"] = "gzip"
+
+    BYTES_OUT.inc(len(body))
+
+    return Response(content=body, media_type="image/svg+xml", headers=headers)
+
+
+@app.post("/render/{render_id}/title")
+@limiter.limit(rate_limit_per_minute)
+def change_title(request: Request, response: Response, render_id: str, title: str = Form(...)):
+    """Change the title of a render, the render service regenerates only its page headers (and PDF)"""
+    title = title.strip()
+
+    if not RENDER_ID_PATTERN.match(render_id) or not title or len(title) > MAX_TITLE_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Title must be 1-{MAX_TITLE_LENGTH} characters.")
+
+    retitle_response = requests.post(
+        RENDER_RETITLE_URL,
+        json={"bucket_name": get_bucket().name, "render_id": render_id, "title": title},
+        headers=render_service_headers(),
+    )
+
+    if not retitle_response.ok:
+        status_code = retitle_response.status_code if retitle_response.status_code in [404, 409] else 502
+        raise HTTPException(status_code=status_code,
+                            detail=render_service_error(retitle_response, "Unable to change title."))
+
+    log_analytics_event(
+        event_type="retitle",
+        render_id=render_id,
+        title=title,
+    )
+
+    return retitle_response.json()
+
+
+def find_pdf_blob(render_id: str):
+    """Find the PDF blob for render_id by exact key from the manifest, listing only for renders that predate it"""
+    manifest = load_render_manifest(render_id)
+    bucket = get_bucket()
+
+    if manifest is not None:
+        artifact = find_manifest_artifact(manifest, "pdf")
+
+        if artifact is not None:
+            return bucket.blob(artifact["name"])
+
+        if not find_manifest_artifact(manifest, "colormusic_svg"):
+            return None
+
+        # Rendered without a PDF (PDF_ON_DEMAND), have the render service print the stored pages now
+        response = requests.post(RENDER_PDF_URL, json={"bucket_name": bucket.name, "render_id": render_id},
+                                 headers=render_service_headers())
+
+        if not response.ok:
+            raise HTTPException(status_code=502, detail=render_service_error(response, "Unable to generate PDF."))
+
+        return bucket.blob(response.json()["name"])
+
+    for blob in bucket.list_blobs(prefix=f"{render_id}/"):
         if blob.name.endswith(".pdf"):
-            # Download the blob into memory
-            pdf_io = io.BytesIO()
-            blob.download_to_file(pdf_io)
-            pdf_io.seek(0)
-
-            return StreamingResponse(
-                pdf_io,
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f'attachment; filename="{blob.name.split("/")[-1]}"'
-                },
-            )
-    
-    raise HTTPException(status_code=404, detail="PDF not found in GCS!")
+            return blob
+
+    return None
+
+
+def parse_range_header(range_header: str, size: int):
+    """Parse a single byte range ("bytes=start-end", "bytes=start-", "bytes=-suffix") into inclusive offsets.
+
+    Returns None when the header should be ignored (absent, malformed or multiple ranges) and raises
+    HTTPException 416 when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+
+    try:
+        if start:
+            start = int(start)
+            end = int(end) if end else size - 1
+        else:
+            # Suffix range, last N bytes
+            start = max(size - int(end), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    return start, min(end, size - 1)
+
+
+def iter_blob_range(blob, start: int, end: int, chunk_size: int = PDF_DOWNLOAD_CHUNK_SIZE):
+    """Yield the inclusive byte range [start, end] of a blob in chunks, without buffering the whole object"""
+    position = start
+
+    while position <= end:
+        chunk_end = min(position + chunk_size - 1, end)
+        chunk = blob.download_as_bytes(start=position, end=chunk_end)
+        BYTES_OUT.inc(len(chunk))
+
+        yield chunk
+        position = chunk_end + 1
+
+
+@app.get("/download-pdf")
+def download_pdf(request: Request, render_id: str):
+    if not RENDER_ID_PATTERN.match(render_id):
+        raise HTTPException(status_code=400, detail="Invalid render id.")
+
+    blob = find_pdf_blob(render_id)
+
+    if blob is None:
+        raise HTTPException(status_code=404, detail="PDF not found in GCS!")
+
+    pdf_filename = blob.name.split("/")[-1]
+    content_disposition = f'attachment; filename="{pdf_filename}"'
+
+    if PDF_DOWNLOAD_MODE == "redirect":
+        signed_url = blob.generate_signed_url(
+            version="v4",
+            expiration=PDF_SIGNED_URL_EXPIRATION,
+            method="GET",
+            response_disposition=content_disposition,
+            response_type="application/pdf",
+        )
+
+        return RedirectResponse(signed_url, status_code=307)
+
+    try:
+        # Metadata only (size, generation), pins all ranged reads below to this generation
+        blob.reload()
+    except NotFound:
+        raise HTTPException(status_code=404, detail="PDF not found in GCS!")
+
+    etag = f'"{blob.generation}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": content_disposition,
+    }
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    size = blob.size
+    byte_range = None
+
+    # Only honour Range if the client's cached copy (If-Range) is still current
+    if request.headers.get("if-range", etag) == etag:
+        byte_range = parse_range_header(request.headers.get("range"), size)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        iter_blob_range(blob, start, end),
+        status_code=status_code,
+        media_type="application/pdf",
+        headers=headers,
+    )
@@ -0,0 +1,48 @@
+# Third-party Libraries
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from analytics import get_shipper
+
+# Uploads include MusicXML conversion and the full downstream render
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, )
+
+UPLOAD_SECONDS = Histogram(
+    "colormusic_upload_seconds", "End to end upload (conversion + render) latency by input format", ["input_format"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_STAGE_SECONDS = Histogram(
+    "colormusic_upload_stage_seconds", "Upload latency per stage", ["stage"], buckets=LATENCY_BUCKETS,
+)
+UPLOADS_TOTAL = Counter("colormusic_uploads_total", "Uploads by outcome", ["outcome"])
+UPLOADS_IN_PROGRESS = Gauge("colormusic_uploads_in_progress", "Uploads currently being processed")
+
+BYTES_IN = Counter("colormusic_bytes_in_total", "Bytes received from clients (uploaded scores)")
+BYTES_OUT = Counter("colormusic_bytes_out_total", "Bytes sent to clients from storage (PDFs, page SVGs)")
+
+CACHE_REQUESTS = Counter("colormusic_cache_requests_total", "In-process cache lookups", ["cache", "result"])
+
+CONVERSION_IN_USE = Gauge("colormusic_conversion_in_use", "Verovio MusicXML conversion workers in use")
+VEROVIO_TIMEOUTS = Counter("colormusic_verovio_timeouts_total", "MusicXML conversions that hit the Verovio timeout")
+
+ANALYTICS_QUEUE_DEPTH = Gauge("colormusic_analytics_queue_depth", "Analytics events waiting to be shipped")
+ANALYTICS_QUEUE_DEPTH.set_function(lambda: get_shipper().queue.qsize())
+ANALYTICS_DROPPED = Gauge("colormusic_analytics_dropped", "Analytics events dropped due to a full queue")
+ANALYTICS_DROPPED.set_function(lambda: get_shipper().dropped)
+
+
+def observe_upload(timer, input_format, elapsed_seconds):
+    """Record a completed upload's latency and per stage spans"""
+    UPLOAD_SECONDS.labels(input_format=input_format).observe(elapsed_seconds)
+
+    for stage, duration_ms in timer.spans:
+        UPLOAD_STAGE_SECONDS.labels(stage=stage).observe(duration_ms / 1000)
+
+
+def observe_cache(cache, hit):
+    """Record an in-process cache hit or miss, hit ratio = hit / (hit + miss)"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def metrics_payload():
+    """Prometheus text exposition of all metrics, returns (body, content_type)"""
+    return generate_latest(), CONTENT_TYPE_LATEST
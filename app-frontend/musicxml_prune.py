@@ -0,0 +1,84 @@
+# Standard Libraries
+import io
+import os
+import time
+
+# Third-party Libraries
+from lxml import etree
+
+# MusicXML elements that never make it into ColorMusic output (chord diagrams, layout hints, playback)
+DEFAULT_DENY_TAGS = (
+    "harmony",
+    "figured-bass",
+    "print",
+    "sound",
+    "listening",
+    "grouping",
+    "bookmark",
+    "link",
+)
+
+
+def get_prune_tags():
+    """Tags to prune, MUSICXML_PRUNE_DENY replaces the default deny list and MUSICXML_PRUNE_ALLOW removes from it"""
+    deny = os.getenv("MUSICXML_PRUNE_DENY")
+    allow = os.getenv("MUSICXML_PRUNE_ALLOW", "")
+
+    deny_tags = [tag.strip() for tag in deny.split(",")] if deny is not None else list(DEFAULT_DENY_TAGS)
+    allow_tags = {tag.strip() for tag in allow.split(",")}
+
+    return [tag for tag in deny_tags if tag and tag not in allow_tags]
+
+
+def prune_musicxml(xml_bytes, deny_tags=None):
+    """Drop unused elements from MusicXML before Verovio conversion.
+
+    Streams the document with iterparse, removing each denied element as soon as it is complete.
+    Returns (pruned_xml_bytes, stats), output is always UTF-8 with the original DOCTYPE.
+    """
+    started = time.perf_counter()
+
+    if deny_tags is None:
+        deny_tags = get_prune_tags()
+
+    stats = {
+        "bytes_before": len(xml_bytes),
+        "bytes_after": len(xml_bytes),
+        "bytes_removed": 0,
+        "nodes_removed": 0,
+        "removed_by_tag": {},
+    }
+
+    if not deny_tags:
+        stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return xml_bytes, stats
+
+    context = etree.iterparse(
+        io.BytesIO(xml_bytes),
+        events=("end", ),
+        tag=deny_tags,
+        huge_tree=True,
+        resolve_entities=False,
+        no_network=True,
+        load_dtd=False,
+    )
+
+    for _, element in context:
+        parent = element.getparent()
+
+        if parent is None:
+            continue  # Never drop the root
+
+        stats["nodes_removed"] += sum(1 for _ in element.iter())
+        stats["bytes_removed"] += len(etree.tostring(element, with_tail=False))
+        stats["removed_by_tag"][element.tag] = stats["removed_by_tag"].get(element.tag, 0) + 1
+
+        element.clear()
+        parent.remove(element)
+
+    pruned_xml_bytes = etree.tostring(context.root.getroottree(), xml_declaration=True, encoding="UTF-8")
+
+    stats["bytes_after"] = len(pruned_xml_bytes)
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    return pruned_xml_bytes, stats
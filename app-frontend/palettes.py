@@ -0,0 +1,45 @@
+# Standard Libraries
+import re
+
+# ColorMusic page SVGs fill pitch coloured shapes from CSS variables set in a <style id="cm-palette"> block
+# (render-service renderer.palette_css), so another palette is a swap of that one block
+PITCH_CLASS_PREFIX = "cm-pitch-"
+PALETTE_STYLE_RE = re.compile(rb'<style[^>]*\bid="cm-palette"[^>]*>.*?</style>', re.DOTALL)
+
+# Pitch classes in chromatic order, flat spelling as in the SVG class names
+PITCH_CLASSES = ["C", "Df", "D", "Ef", "E", "F", "Gf", "G", "Af", "A", "Bf", "B", ]
+
+DEFAULT_PALETTE = "default"
+
+PALETTES = {
+    # As rendered (renderer.PITCH_COLORS)
+    "default": {
+        "C": "#DA1E48", "Df": "#00A995", "D": "#F58220", "Ef": "#3763AF", "E": "#F3DC0B", "F": "#AB218E",
+        "Gf": "#39B54A", "G": "#F04E23", "Af": "#0098DD", "A": "#fdbb13", "Bf": "#823F98", "B": "#A6CE39",
+    },
+    # Darker, more saturated colours that hold up in print and on dim screens
+    "high-contrast": {
+        "C": "#C8102E", "Df": "#007A6C", "D": "#E35205", "Ef": "#1F3F99", "E": "#FFD100", "F": "#8A1A7A",
+        "Gf": "#1E8C2F", "G": "#B22200", "Af": "#0072CE", "A": "#F2A900", "Bf": "#5B2A86", "B": "#7AB800",
+    },
+    # Okabe-Ito and Paul Tol colours, distinguishable with the common colour vision deficiencies
+    "colorblind": {
+        "C": "#D55E00", "Df": "#009E73", "D": "#E69F00", "Ef": "#0072B2", "E": "#F0E442", "F": "#CC79A7",
+        "Gf": "#117733", "G": "#882255", "Af": "#56B4E9", "A": "#DDCC77", "Bf": "#332288", "B": "#999933",
+    },
+}
+
+
+def palette_css(colors):
+    """Palette stylesheet, same form as the render service writes: variables plus the rules filling with them"""
+    variables = ";".join(f"--{PITCH_CLASS_PREFIX}{name}:{colors[name]}" for name in PITCH_CLASSES)
+    rules = "".join(f".{PITCH_CLASS_PREFIX}{name}{{fill:var(--{PITCH_CLASS_PREFIX}{name})}}" for name in PITCH_CLASSES)
+
+    return f"svg{{{variables}}}{rules}"
+
+
+def apply_palette(svg_bytes, palette):
+    """Page SVG with its palette block replaced, unchanged if it has none (renders before palettes)"""
+    style = f'<style id="cm-palette" type="text/css">{palette_css(PALETTES[palette])}</style>'.encode("utf-8")
+
+    return PALETTE_STYLE_RE.sub(lambda _: style, svg_bytes, count=1)
@@ -0,0 +1,64 @@
+# Standard Libraries
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import threading
+
+from metrics import observe_cache
+
+# Rendered page SVGs kept in memory for /render/{render_id}/page/{n}.svg, bounded by total bytes
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PREVIEW_GZIP_LEVEL = 6
+
+
+class PreviewPage:
+    """A page SVG ready to serve: body, gzip variant and strong ETag (sha256 of the body, as in the manifest)"""
+    __slots__ = ("body", "gzip_body", "etag", )
+
+    def __init__(self, body, sha256=None):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=PREVIEW_GZIP_LEVEL)
+        self.etag = f'"{sha256 or hashlib.sha256(body).hexdigest()}"'
+
+    @property
+    def size(self):
+        return len(self.body) + len(self.gzip_body)
+
+
+class PreviewCache:
+    """Thread safe LRU of PreviewPage by key, evicting least recently used pages over max_bytes"""
+    def __init__(self, name, max_bytes=PREVIEW_CACHE_MAX_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page is not None:
+                self._pages.move_to_end(key)
+
+        observe_cache(self.name, hit=page is not None)
+
+        return page
+
+    def put(self, key, page):
+        if page.size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._pages.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+
+            self._pages[key] = page
+            self.size += page.size
+
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= evicted.size
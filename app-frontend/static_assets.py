@@ -0,0 +1,176 @@
+# Standard Libraries
+import gzip
+import hashlib
+import mimetypes
+import os
+
+# Third-party Libraries
+from lxml import etree
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only without it
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PREFIX = "/static"
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=300"
+
+# Not worth compressing (already compressed or tiny)
+COMPRESSIBLE_TYPES = ("image/svg+xml", "text/", "application/javascript", "application/json", )
+MIN_COMPRESS_BYTES = 512
+
+# Editor bookkeeping (Inkscape, Sodipodi, Illustrator), never rendered
+EDITOR_NAMESPACES = {
+    "http://www.inkscape.org/namespaces/inkscape",
+    "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://ns.adobe.com/AdobeIllustrator/10.0/",
+}
+SVG_NS = "{http://www.w3.org/2000/svg}"
+WHITESPACE_SENSITIVE_TAGS = {f"{SVG_NS}text", f"{SVG_NS}tspan", f"{SVG_NS}textPath", f"{SVG_NS}style", }
+
+
+def minify_svg(svg_bytes):
+    """Drop comments, metadata, editor elements/attributes and indentation from an SVG"""
+    parser = etree.XMLParser(resolve_entities=False, no_network=True, remove_comments=True, remove_pis=True,
+                             huge_tree=True)
+    root = etree.fromstring(svg_bytes, parser=parser)
+
+    for element in list(root.iter()):
+        if not isinstance(element.tag, str):
+            continue
+
+        namespace = etree.QName(element).namespace
+
+        if namespace in EDITOR_NAMESPACES or element.tag == f"{SVG_NS}metadata":
+            element.getparent().remove(element)
+            continue
+
+        for attribute in list(element.attrib):
+            if etree.QName(attribute).namespace in EDITOR_NAMESPACES:
+                del element.attrib[attribute]
+
+        if element.tag in WHITESPACE_SENSITIVE_TAGS or element.getparent() is not None and \
+                element.getparent().tag in WHITESPACE_SENSITIVE_TAGS:
+            continue
+
+        # Indentation only, text content is left alone
+        if element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+
+    etree.cleanup_namespaces(root)
+
+    return etree.tostring(root, encoding="utf-8")
+
+
+def fingerprinted_name(relative_path, body):
+    """assets/logo.svg -> assets/logo.<content hash>.svg"""
+    stem, extension = os.path.splitext(relative_path)
+
+    return f"{stem}.{hashlib.sha256(body).hexdigest()[:FINGERPRINT_LENGTH]}{extension}"
+
+
+def accepts_encoding(accept_encoding, coding):
+    """Whether an Accept-Encoding header allows coding (and doesn't refuse it with q=0)"""
+    for accepted in accept_encoding.lower().split(","):
+        name, _, params = accepted.strip().partition(";")
+
+        if name.strip() in [coding, "*"]:
+            return params.replace(" ", "") not in ["q=0", "q=0.0", "q=0.00", "q=0.000"]
+
+    return False
+
+
+class StaticAsset:
+    """A static file prepared once: minified body, gzip/brotli variants and strong ETag"""
+    def __init__(self, relative_path, body, content_type):
+        self.relative_path = relative_path
+        self.content_type = content_type
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        self.encodings = {}
+
+        if content_type.startswith(COMPRESSIBLE_TYPES) and len(body) >= MIN_COMPRESS_BYTES:
+            self.encodings["gzip"] = gzip.compress(body, compresslevel=9)
+
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(body, quality=11)
+
+    def negotiate(self, accept_encoding):
+        """(body, content_encoding or None), the smallest variant the client accepts"""
+        candidates = [(self.body, None)] + [
+            (body, coding) for coding, body in self.encodings.items() if accepts_encoding(accept_encoding, coding)
+        ]
+
+        return min(candidates, key=lambda candidate: len(candidate[0]))
+
+
+class StaticAssets:
+    """Static files minified, precompressed and fingerprinted at startup, served from memory.
+
+    Templates link assets with static_url(), which returns the fingerprinted URL once built (cacheable
+    forever) and the plain /static URL before that.
+    """
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self.by_path = {}  # fingerprinted or original relative path -> StaticAsset
+        self.fingerprints = {}  # original relative path -> fingerprinted relative path
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def build(self):
+        """Read, minify and compress every file under directory, then swap the new index in"""
+        by_path = {}
+        fingerprints = {}
+        bytes_before = 0
+        bytes_after = 0
+
+        for directory, _, filenames in os.walk(self.directory):
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                relative_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+                with open(path, "rb") as f:
+                    body = f.read()
+
+                bytes_before += len(body)
+
+                if content_type == "image/svg+xml":
+                    try:
+                        body = minify_svg(body)
+                    except etree.XMLSyntaxError:
+                        print(f"Unable to minify {relative_path}, serving as is")
+
+                bytes_after += len(body)
+
+                asset = StaticAsset(relative_path, body, content_type)
+                fingerprinted_path = fingerprinted_name(relative_path, body)
+
+                by_path[relative_path] = asset
+                by_path[fingerprinted_path] = asset
+                fingerprints[relative_path] = fingerprinted_path
+
+        self.by_path = by_path
+        self.fingerprints = fingerprints
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_after
+
+    def get(self, relative_path):
+        """(asset, immutable), immutable when requested by its fingerprinted name, (None, False) if unknown"""
+        asset = self.by_path.get(relative_path)
+
+        return asset, asset is not None and self.fingerprints.get(asset.relative_path) == relative_path
+
+    def url(self, relative_path):
+        relative_path = relative_path.lstrip("/")
+
+        return f"{STATIC_URL_PREFIX}/{self.fingerprints.get(relative_path, relative_path)}"
+
+
+static_assets = StaticAssets()
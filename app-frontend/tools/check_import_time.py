@@ -0,0 +1,83 @@
+"""Import-time budget check for the frontend.
+
+Imports main in fresh interpreters (no service account key, no cloud access needed) and fails if the
+median import time is over budget, or if modules that should load lazily were imported at startup.
+
+Usage (from app-frontend/):
+    python tools/check_import_time.py
+    python tools/check_import_time.py --budget-ms 800 --runs 5
+"""
+# Standard Libraries
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1500))
+
+# Created on first use/in the background, importing main must not pull these in
+LAZY_MODULES = [
+    "bs4",
+    "google.cloud.storage",
+    "google.cloud.logging",
+    "google.oauth2.service_account",
+    "google.auth.transport.requests",
+    "verovio",
+]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({"ms": (time.perf_counter() - started) * 1000, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import():
+    """Import main in a fresh interpreter, returns (ms, imported module names)"""
+    env = {key: value for key, value in os.environ.items() if key != "COLORMUSIC_SA_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=FRONTEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+    return measured["ms"], set(measured["modules"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the frontend's import time and lazy imports")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="Max median import time")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreter imports, median is checked")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        try:
+            ms, modules = measure_import()
+        except subprocess.CalledProcessError as e:
+            print(f"FAIL import main raised (it must not need credentials or network):\n{e.stderr}")
+            sys.exit(1)
+
+        timings.append(ms)
+
+    median_ms = statistics.median(timings)
+    eager = [module for module in LAZY_MODULES if module in modules]
+
+    print(f"import main: median {median_ms:.0f}ms over {args.runs} runs (budget {args.budget_ms:.0f}ms)")
+
+    for module in eager:
+        print(f"FAIL {module} is imported at startup, it should load on first use")
+
+    if median_ms > args.budget_ms:
+        print(f"FAIL import time over budget by {median_ms - args.budget_ms:.0f}ms")
+
+    if eager or median_ms > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Load test the frontend + render service: /start-render -> /upload -> /download-pdf flows at a fixed concurrency.
+
+Scores are the prototype/tests corpus (plus optional synthetic scores).  Reports throughput, latency
+percentiles per step and the error rate.  Use run_local.sh to boot both services with the local profile.
+
+Usage:
+    python loadtest/load_test.py --url http://127.0.0.1:10000 --concurrency 8 --requests 100
+    python loadtest/load_test.py --url http://127.0.0.1:10000 --concurrency 4 --duration 120 --synthetic 64 256
+"""
+# Standard Libraries
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party Libraries
+import requests
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RENDER_SERVICE_DIR = os.path.join(ROOT_DIR, "render-service")
+
+STEPS = ["start_render", "upload", "download_pdf", "flow", ]
+PERCENTILES = [50, 90, 95, 99, ]
+
+
+def load_scores(score_names=None, synthetic_measures=None):
+    """[(name, mei_data)] from the benchmark corpus and generator"""
+    sys.path.insert(0, RENDER_SERVICE_DIR)
+
+    from benchmarks.corpus import load_corpus, load_scores as read_scores, synthetic_scores
+
+    return read_scores(load_corpus(score_names)) + synthetic_scores(synthetic_measures or [])
+
+
+def wait_for(urls, timeout=120):
+    """Block until each url answers (services booting)"""
+    deadline = time.monotonic() + timeout
+
+    for url in urls:
+        while True:
+            try:
+                requests.get(url, timeout=5)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+                time.sleep(0.5)
+
+
+def run_flow(session, base_url, name, mei_data, download_pdf):
+    """One user flow, returns {"ok", "error", "<step>_ms"...}"""
+    result = {"score": name, "ok": False, "error": None}
+    started = time.perf_counter()
+
+    try:
+        step_started = time.perf_counter()
+        response = session.get(f"{base_url}/start-render", timeout=30)
+        result["start_render_ms"] = (time.perf_counter() - step_started) * 1000
+        response.raise_for_status()
+        render_id = response.json()["render_id"]
+
+        step_started = time.perf_counter()
+        response = session.post(
+            f"{base_url}/upload",
+            data={"title": name, "render_id": render_id},
+            files={"file": (f"{name}.mei", mei_data.encode("utf-8"), "application/xml")},
+            timeout=600,
+        )
+        result["upload_ms"] = (time.perf_counter() - step_started) * 1000
+        response.raise_for_status()
+
+        # Errors come back as 200 + an HTML message, a rendered result always has the page preview
+        if "svg-page" not in response.text:
+            raise RuntimeError(f"upload failed: {response.text[:200]}")
+
+        if download_pdf:
+            step_started = time.perf_counter()
+            response = session.get(f"{base_url}/download-pdf", params={"render_id": render_id}, timeout=120)
+            result["download_pdf_ms"] = (time.perf_counter() - step_started) * 1000
+            response.raise_for_status()
+
+            if not response.content.startswith(b"%PDF"):
+                raise RuntimeError("download-pdf did not return a PDF")
+
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"[:300]
+
+    result["flow_ms"] = (time.perf_counter() - started) * 1000
+
+    return result
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+
+    return sorted_values[max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(results, elapsed, concurrency):
+    ok = [result for result in results if result["ok"]]
+    summary = {
+        "concurrency": concurrency,
+        "flows": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_flows_per_s": round(len(ok) / elapsed, 3) if elapsed else 0,
+        "latency_ms": {},
+        "error_samples": sorted({result["error"] for result in results if result["error"]})[:10],
+    }
+
+    for step in STEPS:
+        # Latency over successful flows only, failures are counted in error_rate
+        values = sorted(result[f"{step}_ms"] for result in ok if f"{step}_ms" in result)
+
+        if values:
+            summary["latency_ms"][step] = {
+                f"p{pct}": round(percentile(values, pct), 1) for pct in PERCENTILES
+            }
+            summary["latency_ms"][step]["max"] = round(values[-1], 1)
+
+    return summary
+
+
+def run_load_test(base_url, scores, concurrency, total_requests=None, duration=None, download_pdf=True):
+    """Run flows over the scores round robin until total_requests or duration is reached"""
+    score_cycle = itertools.cycle(scores)
+    lock = threading.Lock()
+    results = []
+    issued = 0
+    deadline = time.monotonic() + duration if duration else None
+
+    def next_score():
+        nonlocal issued
+
+        with lock:
+            if total_requests is not None and issued >= total_requests:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+            issued += 1
+
+            return next(score_cycle)
+
+    def worker():
+        session = requests.Session()
+
+        while (score := next_score()) is not None:
+            result = run_flow(session, base_url, *score, download_pdf=download_pdf)
+
+            with lock:
+                results.append(result)
+
+                if not result["ok"]:
+                    print(f"ERROR {result['score']}: {result['error']}", file=sys.stderr)
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+
+    return summarize(results, time.perf_counter() - started, concurrency)
+
+
+def print_summary(summary):
+    print(f"\n{summary['flows']} flows at concurrency {summary['concurrency']} in {summary['elapsed_s']}s: "
+          f"{summary['throughput_flows_per_s']} flows/s, error rate {summary['error_rate'] * 100:.1f}%")
+
+    for step, latencies in summary["latency_ms"].items():
+        print(f"    {step:<14} " + "  ".join(f"{name}={ms:.0f}ms" for name, ms in latencies.items()))
+
+    for error in summary["error_samples"]:
+        print(f"    error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the upload -> render -> PDF flow")
+    parser.add_argument("--url", default="http://127.0.0.1:10000", help="Frontend base URL")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent simulated users")
+    parser.add_argument("--requests", type=int, help="Total flows to run (default 10 per user)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a flow count")
+    parser.add_argument("--scores", nargs="*", help="Corpus score names (ex. Creep), default all")
+    parser.add_argument("--synthetic", nargs="*", type=int, help="Also upload generated scores with these measure counts")
+    parser.add_argument("--skip-pdf", action="store_true", help="Skip /download-pdf (render service without Chromium)")
+    parser.add_argument("--wait-for", nargs="*", default=[], help="Extra URLs to wait on before starting")
+    parser.add_argument("--output", help="Save the summary as JSON")
+    args = parser.parse_args()
+
+    scores = load_scores(args.scores, args.synthetic)
+
+    if not scores:
+        parser.error("No scores to upload")
+
+    total_requests = args.requests
+    if total_requests is None and args.duration is None:
+        total_requests = args.concurrency * 10
+
+    wait_for([f"{args.url}/healthz", *args.wait_for])
+
+    summary = run_load_test(args.url, scores, args.concurrency, total_requests, args.duration,
+                            download_pdf=not args.skip_pdf)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    if summary["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
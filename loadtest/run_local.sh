@@ -0,0 +1,29 @@
+#!/bin/bash
+# Boot render-service and app-frontend with the local profile, run the load test against them, then stop both.
+#   loadtest/run_local.sh --concurrency 8 --requests 100
+set -euo pipefail
+
+ROOT_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+RENDER_PORT="${RENDER_PORT:-8080}"
+FRONTEND_PORT="${FRONTEND_PORT:-10000}"
+RENDER_WORKERS="${RENDER_WORKERS:-1}"
+FRONTEND_WORKERS="${FRONTEND_WORKERS:-1}"
+
+set -a
+source "$ROOT_DIR/loadtest/local.env"
+set +a
+export RENDER_SERVICE_URL="http://127.0.0.1:$RENDER_PORT/render-color-music"
+
+mkdir -p "$LOCAL_STORAGE_ROOT" "$(dirname "$ANALYTICS_JSONL_PATH")"
+
+(cd "$ROOT_DIR/render-service" && exec uvicorn app.main:app --port "$RENDER_PORT" --workers "$RENDER_WORKERS" --log-level warning) &
+RENDER_PID=$!
+(cd "$ROOT_DIR/app-frontend" && exec uvicorn main:app --port "$FRONTEND_PORT" --workers "$FRONTEND_WORKERS" --log-level warning) &
+FRONTEND_PID=$!
+
+trap 'kill $RENDER_PID $FRONTEND_PID 2>/dev/null; wait 2>/dev/null' EXIT
+
+python "$ROOT_DIR/loadtest/load_test.py" \
+    --url "http://127.0.0.1:$FRONTEND_PORT" \
+    --wait-for "http://127.0.0.1:$RENDER_PORT/metrics" \
+    "$@"
@@ -0,0 +1,215 @@
+# Standard Libraries
+from collections import Counter
+import os
+import re
+
+# Third-party Libraries
+from lxml import etree
+
+# Compaction steps applied to ColorMusic page SVGs after colourisation, comma separated ("none" to disable)
+SVG_COMPACT_STEPS = ["whitespace", "titles", "precision", "defs", "classes", ]
+SVG_COMPACT = os.getenv("SVG_COMPACT", ",".join(SVG_COMPACT_STEPS))
+
+# Decimal places kept in coordinates/lengths
+SVG_PRECISION = int(os.getenv("SVG_PRECISION", 2))
+
+# Presentation attribute sets repeated at least this many times are replaced by a class
+SVG_HOIST_MIN_COUNT = int(os.getenv("SVG_HOIST_MIN_COUNT", 3))
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+TEXT_TAGS = {f"{{{SVG_NS}}}{tag}" for tag in ["text", "tspan", "textPath", "style", "title", "desc", ]}
+
+GEOMETRY_ATTRIBUTES = ["x", "y", "cx", "cy", "r", "rx", "ry", "width", "height", "x1", "y1", "x2", "y2", "d",
+                       "points", "transform", ]
+DECIMAL_RE = re.compile(r"-?\d*\.\d+")
+
+# Presentation attributes that are also CSS properties, with whether unitless values need "px" in CSS
+HOISTABLE_ATTRIBUTES = {
+    "fill": False,
+    "fill-opacity": False,
+    "opacity": False,
+    "stroke": False,
+    "stroke-linecap": False,
+    "stroke-linejoin": False,
+    "stroke-opacity": False,
+    "stroke-width": True,
+    "font-size": True,
+    "font-style": False,
+    "font-weight": False,
+    "text-anchor": False,
+}
+NUMBER_RE = re.compile(r"^-?\d*\.?\d+$")
+HOISTED_CLASS_PREFIX = "cm-s"
+
+URL_REF_RE = re.compile(r"url\(#([^)]+)\)")
+
+
+def compact_steps(setting=SVG_COMPACT):
+    """Enabled steps from a SVG_COMPACT style setting, in the order they run"""
+    enabled = {step.strip() for step in setting.lower().split(",")}
+
+    return [step for step in SVG_COMPACT_STEPS if step in enabled]
+
+
+def strip_whitespace(root):
+    """Drop indentation between elements, text content is left alone"""
+    for element in root.iter(etree.Element):
+        if element.getparent() is not None and element.getparent().tag in TEXT_TAGS:
+            continue
+
+        if element.tag not in TEXT_TAGS and element.text is not None and not element.text.strip():
+            element.text = None
+        if element.tail is not None and not element.tail.strip():
+            element.tail = None
+
+
+def strip_titles(root):
+    """Drop <title> elements (Verovio's per-note labelAttr titles, only needed during colourisation)"""
+    for title in list(root.iter(f"{{{SVG_NS}}}title")):
+        parent = title.getparent()
+
+        # Keep what followed the title
+        if title.tail:
+            previous = title.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or "") + title.tail
+            else:
+                parent.text = (parent.text or "") + title.tail
+
+        parent.remove(title)
+
+
+def format_decimal(match, precision):
+    value = f"{float(match.group()):.{precision}f}".rstrip("0").rstrip(".")
+
+    return "0" if value in ["-0", ""] else value
+
+
+def round_coordinates(root, precision=SVG_PRECISION):
+    """Round decimals in geometry attributes to precision places"""
+    def replace(match):
+        return format_decimal(match, precision)
+
+    for element in root.iter(etree.Element):
+        for attribute in GEOMETRY_ATTRIBUTES:
+            value = element.get(attribute)
+
+            if value is not None and "." in value:
+                element.set(attribute, DECIMAL_RE.sub(replace, value))
+
+
+def referenced_ids(root):
+    """Ids referenced by href/xlink:href="#id" or url(#id) anywhere in the document"""
+    ids = set()
+
+    for element in root.iter(etree.Element):
+        for attribute, value in element.attrib.items():
+            if attribute in [XLINK_HREF, "href"] and value.startswith("#"):
+                ids.add(value[1:])
+            elif "url(#" in value:
+                ids.update(URL_REF_RE.findall(value))
+
+    return ids
+
+
+def drop_unused_defs(root):
+    """Drop definitions (e.g. ColorMusic square notehead symbols) nothing on the page uses"""
+    used = referenced_ids(root)
+
+    for defs in list(root.iter(f"{{{SVG_NS}}}defs")):
+        for definition in list(defs):
+            if definition.get("id") is not None and definition.get("id") not in used:
+                defs.remove(definition)
+
+
+def css_declarations(attributes):
+    declarations = []
+
+    for attribute, value in attributes:
+        if HOISTABLE_ATTRIBUTES[attribute] and NUMBER_RE.match(value):
+            value = f"{value}px"
+
+        declarations.append(f"{attribute}:{value}")
+
+    return ";".join(declarations)
+
+
+def hoist_attributes(root, min_count=SVG_HOIST_MIN_COUNT, class_prefix=HOISTED_CLASS_PREFIX):
+    """Replace repeated sets of presentation attributes with classes defined in a <style> block.
+
+    Rules are wrapped in :where() (zero specificity), so like the attributes they replace they lose to any other
+    rule (Verovio's stylesheet, the palette).  The rules apply document wide once pages are inlined in one HTML
+    document (the PDF), so class_prefix must be unique per page there.
+    """
+    # Definitions keep their attributes, so they stay identical across pages and can be shared (see shared_defs)
+    defined = {element for defs in root.iter(f"{{{SVG_NS}}}defs") for element in defs.iter(etree.Element)}
+
+    def hoistable(element):
+        if element in defined:
+            return ()
+
+        return tuple(sorted((attribute, value) for attribute, value in element.attrib.items()
+                            if attribute in HOISTABLE_ATTRIBUTES))
+
+    counts = Counter(key for key in map(hoistable, root.iter(etree.Element)) if key)
+    classes = {}
+
+    for key, count in counts.most_common():
+        if count < min_count:
+            break
+
+        classes[key] = f"{class_prefix}{len(classes)}"
+
+    if not classes:
+        return
+
+    for element in root.iter(etree.Element):
+        class_name = classes.get(hoistable(element))
+
+        if class_name is None:
+            continue
+
+        for attribute, _ in hoistable(element):
+            del element.attrib[attribute]
+
+        element.set("class", f"{element.get('class')} {class_name}" if element.get("class") else class_name)
+
+    style = etree.Element(f"{{{SVG_NS}}}style", type="text/css")
+    style.text = "".join(f":where(.{class_name}){{{css_declarations(key)}}}" for key, class_name in classes.items())
+    root.insert(0, style)
+
+
+def page_class_prefix(page):
+    """Hoisted class prefix for a page of a render ("cm-s3-"), unique across the pages printed together"""
+    return f"{HOISTED_CLASS_PREFIX}{page}-"
+
+
+def compact_svg(svg_markup, steps=None, precision=SVG_PRECISION, class_prefix=HOISTED_CLASS_PREFIX):
+    """Compact a page SVG (markup string) with the enabled steps, returns the compacted markup"""
+    if steps is None:
+        steps = compact_steps()
+
+    if not steps:
+        return svg_markup
+
+    parser = etree.XMLParser(huge_tree=True)
+    root = etree.fromstring(svg_markup.encode("utf-8"), parser=parser)
+
+    if "whitespace" in steps:
+        strip_whitespace(root)
+
+    if "titles" in steps:
+        strip_titles(root)
+
+    if "precision" in steps:
+        round_coordinates(root, precision)
+
+    if "defs" in steps:
+        drop_unused_defs(root)
+
+    if "classes" in steps:
+        hoist_attributes(root, class_prefix=class_prefix)
+
+    return etree.tostring(root, encoding="unicode")
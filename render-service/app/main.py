@@ -1,29 +1,100 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+import os
+import threading
 import traceback
+import uuid
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from google.cloud import logging
-from google.cloud import storage
+from .analytics import log_analytics_event, shutdown_analytics
+from .local_storage import LocalStorageClient
+from .metrics import BYTES_IN, RENDERS_IN_PROGRESS, RENDERS_TOTAL, metrics_payload, observe_render
+from .pdf import pdf_backend
+from .profiling import PROFILE_HEADER, should_profile
+from .renderer import page_html, render, render_pdf, retitle, warm_toolkit
+from .startup import startup
+from .timing import StageTimer
 
-from .renderer import render
+# Storage is GCS ("gcs") or a local directory shared with the frontend ("local", offline runs/load tests)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "/tmp/colormusic-storage")
 
-app = FastAPI()
+# Warm Verovio and Chromium in the background at startup, /readyz reports when done (immediately if disabled)
+WARM_UP_ENABLED = os.getenv("WARM_UP_ENABLED", "1") == "1"
 
-gcs_client = storage.Client()
+_gcs_client = None
+_gcs_client_lock = threading.Lock()
 
-logger = logging.Client().logger("colormusic-analytics-log")
 
-def log_analytics_event(event_type, severity="INFO", **kwargs):
-    """Log a structured analytics event to Cloud Logging."""
-    log_entry = {
-        "tag": "colormusic-analytics",
-        "event_type": event_type,
-        **kwargs
-    }
+def get_storage_client():
+    """Get the storage client, created on first use"""
+    global _gcs_client
+
+    if _gcs_client is None:
+        with _gcs_client_lock:
+            if _gcs_client is None:
+                if STORAGE_BACKEND == "local":
+                    _gcs_client = LocalStorageClient(LOCAL_STORAGE_ROOT)
+                else:
+                    from google.cloud import storage
+
+                    _gcs_client = storage.Client()
+
+    return _gcs_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_steps = [
+        ("storage_client", get_storage_client),
+        ("verovio", warm_toolkit),
+        ("pdf_backend", pdf_backend.start),
+    ]
+
+    startup.start(warm_up_steps if WARM_UP_ENABLED else [], import_ms=(time.perf_counter() - IMPORT_STARTED) * 1000)
+
+    yield
+
+    pdf_backend.shutdown()
 
-    logger.log_struct(log_entry, severity=severity)
+    # Drain queued analytics events before the instance goes away
+    shutdown_analytics()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Preview SVG compresses ~5-10x, for clients sending Accept-Encoding: gzip (requests does by default)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Clients accepting this get the preview pages as raw SVG parts instead of HTML strings inside JSON
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+
+
+def multipart_svg_response(page_svgs, headers=None):
+    """multipart/mixed response with one image/svg+xml part per page"""
+    boundary = uuid.uuid4().hex
+    body = []
+
+    for page, svg_markup in enumerate(page_svgs, start=1):
+        body.append(
+            f"--{boundary}\r\nContent-Type: image/svg+xml; charset=utf-8\r\nContent-ID: <page-{page}>\r\n\r\n"
+            f"{svg_markup}\r\n"
+        )
+
+    body.append(f"--{boundary}--\r\n")
+
+    return Response(
+        content="".join(body).encode("utf-8"),
+        media_type=f"{MULTIPART_MEDIA_TYPE}; boundary={boundary}",
+        headers=headers,
+    )
 
 
 class RenderRequest(BaseModel):
@@ -31,33 +102,71 @@ class RenderRequest(BaseModel):
     title: str
     bucket_name: str
     render_id: str
+    profile: bool = False
+    generate_pdf: bool = True  # False defers the PDF to /render-pdf, for users who only view the pages
+
+
+class RenderPdfRequest(BaseModel):
+    bucket_name: str
+    render_id: str
+
+
+class RetitleRequest(BaseModel):
+    bucket_name: str
+    render_id: str
+    title: str
 
 
 @app.post("/render-color-music")
-def render_color_music(request: RenderRequest):
+def render_color_music(request: RenderRequest, http_request: Request, response: Response,
+                       profile_header: str | None = Header(default=None, alias=PROFILE_HEADER)):
     """Render to ColorMusic"""
     # Example processing: make it uppercase
     # message = f"filename: {request.filename}, title: {request.title}, bucket_name: {request.bucket_name}, render_id: {request.render_id}"
 
     # logging.info(message)
 
+    # Requests arriving during warm-up wait for it rather than racing it for the toolkit
+    startup.wait()
+
     filename = request.filename
     title = request.title
-    bucket = gcs_client.bucket(request.bucket_name) 
+    bucket = get_storage_client().bucket(request.bucket_name)
     render_id = request.render_id
+    timer = StageTimer()
+    started = time.perf_counter()
     
     try:
-        # Download MEI content as string
-        blob = bucket.blob(f"{render_id}/{filename}")
-        mei_data = blob.download_as_text(encoding="utf-8")
-        
-        svg_html_parts = render(filename, mei_data, title, bucket, render_id)
+        with RENDERS_IN_PROGRESS.track_inprogress():
+            # Download MEI content as string
+            with timer.span("download"):
+                blob = bucket.blob(f"{render_id}/{filename}")
+                mei_bytes = blob.download_as_bytes()
+                mei_data = mei_bytes.decode("utf-8")
+
+            BYTES_IN.inc(len(mei_bytes))
+            
+            profile = should_profile(request.profile or profile_header == "1")
+            page_svgs = render(filename, mei_data, title, bucket, render_id, timer=timer, profile=profile,
+                               generate_pdf=request.generate_pdf)
 
-        if len(svg_html_parts) == 0:
+        if len(page_svgs) == 0:
             raise ValueError("SVG HTML Parts should not be empty.")
+
+        RENDERS_TOTAL.labels(outcome="success").inc()
+        observe_render(timer, timer.summary().get("render_svg", {}).get("count", 0), time.perf_counter() - started)
+
+        server_timing = timer.server_timing()
+
+        if MULTIPART_MEDIA_TYPE in http_request.headers.get("accept", ""):
+            return multipart_svg_response(page_svgs, headers={"Server-Timing": server_timing})
+
+        response.headers["Server-Timing"] = server_timing
         
-        return {"result": svg_html_parts}
+        return {"result": [page_html(svg_markup) for svg_markup in page_svgs]}
     except:
+        RENDERS_TOTAL.labels(outcome="error").inc()
+
         log_analytics_event(
             event_type="render_error", 
             severity="ERROR", 
@@ -73,4 +182,95 @@ def render_color_music(request: RenderRequest):
                 "status": "error",
                 "error": f"Unable to process file.  Error event has been captured for render id: {render_id}."
             }
-        )
\ No newline at end of file
+        )
+
+
+@app.post("/render-pdf")
+def render_pdf_endpoint(request: RenderPdfRequest, response: Response):
+    """Generate the PDF of an earlier render from its stored pages (no-op if it already has one)"""
+    startup.wait()
+
+    render_id = request.render_id
+    timer = StageTimer()
+
+    try:
+        artifact = render_pdf(get_storage_client().bucket(request.bucket_name), render_id, timer=timer)
+    except:
+        log_analytics_event(
+            event_type="render_error",
+            severity="ERROR",
+            render_id=render_id,
+            stack_trace=traceback.format_exc()
+        )
+
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "error": f"Unable to generate PDF.  Error event has been captured for render id: {render_id}."
+            }
+        )
+
+    if artifact is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"No render found for {render_id}."})
+
+    response.headers["Server-Timing"] = timer.server_timing()
+
+    return {"name": artifact["name"]}
+
+
+@app.post("/retitle")
+def retitle_endpoint(request: RetitleRequest, response: Response):
+    """Change the title of an earlier render, only its page headers (and PDF, if printed) are regenerated"""
+    startup.wait()
+
+    render_id = request.render_id
+    timer = StageTimer()
+
+    try:
+        manifest = retitle(get_storage_client().bucket(request.bucket_name), render_id, request.title, timer=timer)
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"status": "error", "error": str(e)})
+    except:
+        log_analytics_event(
+            event_type="render_error",
+            severity="ERROR",
+            render_id=render_id,
+            title=request.title,
+            stack_trace=traceback.format_exc()
+        )
+
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "error": f"Unable to change title.  Error event has been captured for render id: {render_id}."
+            }
+        )
+
+    if manifest is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"No render found for {render_id}."})
+
+    response.headers["Server-Timing"] = timer.server_timing()
+
+    return {"title": manifest["title"], "revision": manifest["header"]["revision"]}
+
+
+@app.get("/readyz")
+def readyz():
+    """Ready once Verovio and the PDF browser are warm, 503 until then (or if warm-up failed)"""
+    content = {
+        "status": startup.status,
+        "error": startup.error,
+        "startup_ms": startup.breakdown(),
+    }
+
+    return JSONResponse(status_code=200 if startup.ready else 503, content=content)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics"""
+    body, content_type = metrics_payload()
+
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,55 @@
+# Third-party Libraries
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from .analytics import get_shipper
+
+# Renders run from well under a second to minutes for large scores
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, )
+
+RENDER_SECONDS = Histogram(
+    "colormusic_render_seconds", "End to end render latency by page count", ["pages"], buckets=LATENCY_BUCKETS,
+)
+RENDER_STAGE_SECONDS = Histogram(
+    "colormusic_render_stage_seconds", "Render latency per stage (per page/upload for repeated stages)", ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+RENDERS_TOTAL = Counter("colormusic_renders_total", "Renders by outcome", ["outcome"])
+RENDERS_IN_PROGRESS = Gauge("colormusic_renders_in_progress", "Renders currently being processed")
+
+BYTES_IN = Counter("colormusic_bytes_in_total", "Bytes read from storage (input MEI)")
+BYTES_OUT = Counter("colormusic_bytes_out_total", "Bytes written to storage (SVGs, PDF, manifest)")
+
+TOOLKIT_POOL_SIZE = Gauge("colormusic_toolkit_pool_size", "Verovio toolkits available")
+TOOLKIT_IN_USE = Gauge("colormusic_toolkit_in_use", "Verovio toolkits currently in use")
+BROWSER_POOL_SIZE = Gauge("colormusic_browser_pool_size", "Chromium browsers available for PDF generation")
+BROWSER_IN_USE = Gauge("colormusic_browser_in_use", "Chromium browsers currently generating a PDF")
+
+ANALYTICS_QUEUE_DEPTH = Gauge("colormusic_analytics_queue_depth", "Analytics events waiting to be shipped")
+ANALYTICS_QUEUE_DEPTH.set_function(lambda: get_shipper().queue.qsize())
+ANALYTICS_DROPPED = Gauge("colormusic_analytics_dropped", "Analytics events dropped due to a full queue")
+ANALYTICS_DROPPED.set_function(lambda: get_shipper().dropped)
+
+
+def page_count_bucket(page_count):
+    """Coarse page count label, keeps histogram cardinality low"""
+    if page_count <= 1:
+        return "1"
+    elif page_count <= 5:
+        return "2-5"
+    elif page_count <= 20:
+        return "6-20"
+
+    return "21+"
+
+
+def observe_render(timer, page_count, elapsed_seconds):
+    """Record a completed render's latency and per stage spans"""
+    RENDER_SECONDS.labels(pages=page_count_bucket(page_count)).observe(elapsed_seconds)
+
+    for stage, duration_ms in timer.spans:
+        RENDER_STAGE_SECONDS.labels(stage=stage).observe(duration_ms / 1000)
+
+
+def metrics_payload():
+    """Prometheus text exposition of all metrics, returns (body, content_type)"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,115 @@
+# Standard Libraries
+import atexit
+from concurrent.futures import Future, wait
+import os
+import queue
+import threading
+
+from .metrics import BROWSER_POOL_SIZE
+
+PDF_BROWSER_POOL_SIZE = int(os.getenv("PDF_BROWSER_POOL_SIZE", 1))
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", 300))
+PDF_SHUTDOWN_TIMEOUT = 10.0
+
+
+class PdfBackend:
+    """Persistent Chromium browsers for HTML -> PDF, each owned by a dedicated worker thread.
+
+    Playwright's sync API is bound to the thread that started it, so renders hand their HTML to the
+    workers through a queue instead of launching a browser per render.
+    """
+    def __init__(self, pool_size=PDF_BROWSER_POOL_SIZE):
+        self.pool_size = pool_size
+        self.jobs = queue.Queue()
+
+        self._lock = threading.Lock()
+        self._workers = []  # [(thread, launched future)]
+
+    def start(self):
+        """Launch the browsers (once), returns when all are up and raises if any failed to launch"""
+        with self._lock:
+            if self._workers:
+                return
+
+            for n in range(self.pool_size):
+                launched = Future()
+                worker = threading.Thread(target=self._run, args=(launched,), name=f"pdf-worker-{n}", daemon=True)
+                worker.start()
+
+                self._workers.append((worker, launched))
+
+            wait([launched for _, launched in self._workers])
+
+            for _, launched in self._workers:
+                if launched.exception() is not None:
+                    # Stop any browsers that did come up, a later start() retries from scratch
+                    self._stop_workers()
+                    raise launched.exception()
+
+        atexit.register(self.shutdown)
+
+    def html_to_pdf(self, html):
+        """Letter size PDF bytes of an HTML document"""
+        self.start()
+
+        future = Future()
+        self.jobs.put((html, future))
+
+        return future.result(timeout=PDF_TIMEOUT_SECONDS)
+
+    def _run(self, launched):
+        try:
+            # Heavy import, kept off the service's import path
+            from playwright.sync_api import sync_playwright
+
+            playwright = sync_playwright().start()
+            browser = playwright.chromium.launch()
+        except Exception as e:
+            launched.set_exception(e)
+            return
+
+        BROWSER_POOL_SIZE.inc()
+        launched.set_result(True)
+
+        try:
+            while (job := self.jobs.get()) is not None:
+                html, future = job
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    if not browser.is_connected():
+                        browser = playwright.chromium.launch()  # Crashed, relaunch for this and later jobs
+
+                    page = browser.new_page()
+                    try:
+                        page.set_content(html, wait_until="load")
+                        future.set_result(page.pdf(format="Letter", print_background=True))
+                    finally:
+                        page.close()
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            BROWSER_POOL_SIZE.dec()
+            browser.close()
+            playwright.stop()
+
+    def _stop_workers(self):
+        # One stop marker per worker whose browser launched, the others have already exited
+        for _, launched in self._workers:
+            if launched.exception() is None:
+                self.jobs.put(None)
+
+        for worker, _ in self._workers:
+            worker.join(PDF_SHUTDOWN_TIMEOUT)
+
+        self._workers = []
+
+    def shutdown(self):
+        """Close the browsers (if started)"""
+        with self._lock:
+            self._stop_workers()
+
+
+pdf_backend = PdfBackend()
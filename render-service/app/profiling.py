@@ -0,0 +1,48 @@
+# Standard Libraries
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+
+# Requests can opt in with this header (or "profile": true in the body), a fraction can be sampled
+PROFILE_HEADER = "X-ColorMusic-Profile"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_TOP_COUNT = 50
+
+PROFILE_PSTATS_FILENAME = "profile/render.pstats"
+PROFILE_TOP_FILENAME = "profile/top.txt"
+PROFILE_STAGES_FILENAME = "profile/stages.json"
+
+
+def should_profile(requested):
+    """Profile if explicitly requested or sampled per PROFILE_SAMPLE_RATE"""
+    return requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    return profiler
+
+
+def profile_artifacts(profiler, timer):
+    """Stop the profiler, returns [(filename, data, content_type)] for the pstats dump, top hotspots and stage timings"""
+    profiler.disable()
+
+    top_io = io.StringIO()
+    stats = pstats.Stats(profiler, stream=top_io)
+
+    # Same format as pstats.Stats.dump_stats, loadable with pstats.Stats(path)
+    pstats_data = marshal.dumps(stats.stats)
+
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_COUNT)
+
+    return [
+        (PROFILE_PSTATS_FILENAME, pstats_data, "application/octet-stream"),
+        (PROFILE_TOP_FILENAME, top_io.getvalue(), "text/plain"),
+        (PROFILE_STAGES_FILENAME, json.dumps(timer.summary(), indent=2), "application/json"),
+    ]
@@ -1,22 +1,60 @@
 # Standard Libraries
-import io
+from datetime import datetime, timezone
+import hashlib
 import json
 import math
 import os
+import re
+import threading
+import time
 
 # Third-party Libraries
 from bs4 import BeautifulSoup
-from google.cloud import logging
-from playwright.sync_api import sync_playwright
+from google.api_core.exceptions import NotFound, PreconditionFailed
 import verovio
 
-client = logging.Client()
-logger = client.logger("colormusic-analytics-log")
+from .analytics import log_analytics_event
+from .compact import compact_steps, compact_svg, page_class_prefix
+from .metrics import BROWSER_IN_USE, BYTES_OUT, TOOLKIT_IN_USE, TOOLKIT_POOL_SIZE
+from .pdf import pdf_backend
+from .profiling import profile_artifacts, start_profiler
+from .shared_defs import PDF_SHARED_DEFS, URL_REF_RE, share_defs
+from .timing import StageTimer
 
 # Constants
 STROKE_WIDTH = 20
 PAGE_LIMIT = 100  # Set HIGH to avoid cutting off
 DEFAULT_DURATION = 8
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_UPDATE_ATTEMPTS = 5  # Read-modify-write retries when another update of the manifest lands first
+
+# Page headers (title, logo, tunings) are stored apart from the page bodies and overlaid when served/printed
+HEADER_SVG = '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" overflow="visible"/>'
+SVG_OPEN_TAG_RE = re.compile(r"<svg\b[^>]*>")
+
+# Ids Verovio generates for layout elements (page, systems, glyph symbols, ...) carry over between loads in a
+# process, so they are renamed in order of appearance to make the same score render to the same bytes
+XML_ID_RE = re.compile(r'xml:id="([^"]+)"')
+SVG_ID_RE = re.compile(r' id="([^"]+)"')
+GLYPH_SYMBOL_ID_RE = re.compile(r"^[0-9A-F]{4}-(.+)$")  # "<SMuFL code>-<svg id>"
+# Referenced as id="x", href="#x", url(#x), glyph id suffix, in class (milestones name the element they end) and
+# as #x in <style>, only those are renamed so titles, lyrics and other text are left alone
+GENERATED_ID_TOKEN_RE = re.compile(r"\b[a-z][a-z0-9]{4,}\b")
+ID_REFERENCE_ATTRIBUTES = {"id", "href", "xlink:href", "class"}
+SVG_TAG_RE = re.compile(r"<[A-Za-z][^>]*>")
+SVG_ATTRIBUTE_RE = re.compile(r'([\w:-]+)="([^"]*)"')
+SVG_STYLE_RE = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.DOTALL)
+STYLE_ID_SELECTOR_RE = re.compile(r"#([\w-]+)")
+NORMALIZED_ID_PREFIX = "cm"
+# Glyph <symbol>s are listed in the order the process first used them, so they are sorted by id
+DEFS_RE = re.compile(r"(<defs>)(.*?)(\s*</defs>)", re.DOTALL)
+DEFS_SYMBOL_RE = re.compile(r'\s*<symbol id="([^"]+)".*?</symbol>', re.DOTALL)
+
+# ColorMusic logo, a <symbol> defined once and placed with <use>
+LOGO_DEFS_ID = "cm-logo-defs"
+LOGO_SYMBOL_ID = "cm-logo"
+LOGO_SIZE = 50
 
 # Chromatic Scale (Flat Variant)
 CHROMATIC_SCALE = ["C", "Df", "D", "Ef", "E", "F", "Gf", "G", "Af", "A", "Bf", "B", ]
@@ -38,6 +76,15 @@ PITCH_COLORS = {
     "Fs": "#39B54A", "Gf": "#39B54A",
 }
 
+# Pitch class names used in the SVG (the chromatic scale spelling), by PITCH_COLORS key
+PITCH_CLASSES = {pitch: next(name for name in CHROMATIC_SCALE if PITCH_COLORS[name] == color)
+                 for pitch, color in PITCH_COLORS.items()}
+
+# Pitch coloured shapes get a "cm-pitch-<pitch class>" class, filled from a CSS variable of the same name set in
+# the page's palette <style>, so a palette can be swapped without re-rendering
+PITCH_CLASS_PREFIX = "cm-pitch-"
+PALETTE_STYLE_ID = "cm-palette"
+
 # Pitches that are Squares in ColorMusic (exhaustive list containing both flat and sharp variants)
 SQUARE_PITCHES = ["Af", "Gs", 
                   "Bf", "As", 
@@ -46,18 +93,184 @@ SQUARE_PITCHES = ["Af", "Gs",
                   "E", "Ff", 
                   "Gf", "Fs", ]
 
-tk = verovio.toolkit()
 
+def pitch_class(pitch):
+    """CSS class colouring a shape by pitch, e.g. "Cs" -> "cm-pitch-Df" """
+    return f"{PITCH_CLASS_PREFIX}{PITCH_CLASSES[pitch]}"
+
+
+def palette_css(colors=PITCH_COLORS):
+    """Palette stylesheet: a --cm-pitch-<pitch class> variable per pitch class and the rules filling with them"""
+    variables = ";".join(f"--{PITCH_CLASS_PREFIX}{name}:{colors[name]}" for name in CHROMATIC_SCALE)
+    rules = "".join(f".{PITCH_CLASS_PREFIX}{name}{{fill:var(--{PITCH_CLASS_PREFIX}{name})}}"
+                    for name in CHROMATIC_SCALE)
+
+    return f"svg{{{variables}}}{rules}"
+
+
+# Smallest score that exercises font loading and SVG output, for warm-up
+WARMUP_MEI = """<?xml version="1.0" encoding="UTF-8"?>
+<mei xmlns="http://www.music-encoding.org/ns/mei" meiversion="5.0">
+<meiHead><fileDesc><titleStmt><title>Warm-up</title></titleStmt><pubStmt/></fileDesc></meiHead><music><body><mdiv><score>
+<scoreDef><staffGrp><staffDef n="1" lines="5" clef.shape="G" clef.line="2"/></staffGrp></scoreDef>
+<section><measure n="1"><staff n="1"><layer n="1"><note pname="c" oct="4" dur="4"/></layer></staff></measure></section>
+</score></mdiv></body></music></mei>"""
+
+# Verovio's default resource path is per thread (only set on the importing thread), so set it explicitly
+VEROVIO_RESOURCE_PATH = os.path.join(os.path.dirname(verovio.__file__), "data")
+
+_toolkit = None
+_toolkit_lock = threading.Lock()
+
+
+def get_toolkit():
+    """Get the process wide Verovio toolkit, created on first use"""
+    global _toolkit
+
+    if _toolkit is None:
+        with _toolkit_lock:
+            if _toolkit is None:
+                _toolkit = verovio.toolkit(False)
+                _toolkit.setResourcePath(VEROVIO_RESOURCE_PATH)
+                TOOLKIT_POOL_SIZE.set(1)
+
+    return _toolkit
 
-def log_analytics_event(event_type, **kwargs):
-    """Log a structured analytics event to Cloud Logging."""
-    log_entry = {
-        "tag": "colormusic-analytics",
-        "event_type": event_type,
-        **kwargs
+
+def warm_toolkit():
+    """Create the toolkit and render a tiny score, so fonts/resources are loaded before the first request"""
+    tk = get_toolkit()
+
+    with TOOLKIT_IN_USE.track_inprogress():
+        tk.loadData(WARMUP_MEI)
+        tk.renderToSVG(1)
+
+
+# ====== Render Manifest ======
+def new_render_manifest(render_id, filename, title):
+    """Create an empty manifest describing the artifacts stored for a render_id"""
+    return {
+        "version": MANIFEST_VERSION,
+        "render_id": render_id,
+        "source_filename": filename,
+        "title": title,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "page_count": 0,
+        "artifacts": [],
     }
 
-    logger.log_struct(log_entry)
+
+def add_manifest_artifact(manifest, artifact_filename, data, kind, page=None, content_type=None, elapsed_ms=None,
+                          **details):
+    """Record an artifact (size, content hash, page number, timing and any details) in the render manifest"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    manifest["artifacts"].append({
+        "name": f"{manifest['render_id']}/{artifact_filename}",
+        "kind": kind,
+        "page": page,
+        "content_type": content_type,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "elapsed_ms": round(elapsed_ms, 2) if elapsed_ms is not None else None,
+        **details,
+    })
+
+
+def upload_artifact(bucket, manifest, artifact_filename, data, kind, page=None, content_type=None, started=None,
+                    timer=None, **details):
+    """Upload an artifact to the render_id folder and record it in the manifest.
+
+    started is a time.perf_counter() value marking when work on the artifact began, defaults to the upload itself.
+    """
+    if started is None:
+        started = time.perf_counter()
+
+    upload_started = time.perf_counter()
+
+    # SVG/HTML artifacts arrive as text, encode once so the upload, byte count and manifest agree
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    blob = bucket.blob(f"{manifest['render_id']}/{artifact_filename}")
+    blob.upload_from_string(data, content_type=content_type)
+    BYTES_OUT.inc(len(data))
+
+    if timer is not None:
+        timer.record("upload", (time.perf_counter() - upload_started) * 1000)
+
+    add_manifest_artifact(manifest, artifact_filename, data, kind, page=page, content_type=content_type,
+                          elapsed_ms=(time.perf_counter() - started) * 1000, **details)
+
+
+def svg_compaction_summary(manifest, steps):
+    """Steps applied and total page SVG bytes before/after compaction (per page sizes are on the artifacts)"""
+    pages = [artifact for artifact in manifest["artifacts"] if artifact["kind"] == "colormusic_svg"]
+
+    return {
+        "steps": steps,
+        "bytes_before": sum(artifact["uncompacted_size"] for artifact in pages),
+        "bytes_after": sum(artifact["size"] for artifact in pages),
+    }
+
+
+def load_manifest_generation(bucket, render_id):
+    """(manifest, storage generation) for render_id, (None, None) if there is no manifest"""
+    blob = bucket.blob(f"{render_id}/{MANIFEST_FILENAME}")
+
+    try:
+        manifest = json.loads(blob.download_as_text(encoding="utf-8"))
+    except NotFound:
+        return None, None
+
+    return manifest, blob.generation
+
+
+def load_manifest(bucket, render_id):
+    """Load the stored manifest for render_id, None if there is none"""
+    return load_manifest_generation(bucket, render_id)[0]
+
+
+def upload_manifest(bucket, manifest, if_generation_match=None):
+    """Upload the render manifest, stored at a fixed key so artifacts can be looked up without listing.
+
+    With if_generation_match the upload raises PreconditionFailed if the stored manifest has changed since.
+    """
+    manifest_json = json.dumps(manifest, indent=2).encode("utf-8")
+
+    blob = bucket.blob(f"{manifest['render_id']}/{MANIFEST_FILENAME}")
+    blob.upload_from_string(manifest_json, content_type="application/json", if_generation_match=if_generation_match)
+    BYTES_OUT.inc(len(manifest_json))
+
+
+def update_manifest(bucket, render_id, update, timer):
+    """Read-modify-write the manifest of render_id, starting over if another update is written first.
+
+    update(manifest) changes the manifest in place (uploading any new artifacts) and returns (result, changed).
+    The manifest is written only if changed, and only over the generation that was read, so concurrent updates
+    (retitle, on demand PDF) never drop each other's changes.  Returns result, None if there is no manifest.
+    """
+    for attempt in range(1, MANIFEST_UPDATE_ATTEMPTS + 1):
+        manifest, generation = load_manifest_generation(bucket, render_id)
+
+        if manifest is None:
+            return None
+
+        result, changed = update(manifest)
+
+        if not changed:
+            return result
+
+        try:
+            with timer.span("upload"):
+                upload_manifest(bucket, manifest, if_generation_match=generation)
+
+            return result
+        except PreconditionFailed:
+            print(f"Manifest of {render_id} changed during update (attempt {attempt}), retrying")
+
+    raise RuntimeError(f"Manifest of {render_id} kept changing, gave up after {MANIFEST_UPDATE_ATTEMPTS} attempts")
 
 
 # ====== Processing Functions ======
@@ -531,7 +744,7 @@ def render_note_to_colormusic(soup, note, chord):
                                         y=center_y - (square_side) + 30, 
                                         width=square_side, 
                                         height=square_side, 
-                                        fill=PITCH_COLORS[pitch], 
+                                        **{'class': pitch_class(pitch)}, 
                                         stroke='black', 
                                         **{'stroke-width': STROKE_WIDTH, "opacity": ".85", })
                         
@@ -543,7 +756,7 @@ def render_note_to_colormusic(soup, note, chord):
                                         cx=center_x, 
                                         cy=center_y - (circle_radius / 2) - 20, 
                                         r=circle_radius, 
-                                        fill=PITCH_COLORS[pitch], 
+                                        **{'class': pitch_class(pitch)}, 
                                         stroke='black', 
                                         **{'stroke-width': STROKE_WIDTH, "opacity": ".85", })
 
@@ -585,58 +798,51 @@ def render_note_to_colormusic(soup, note, chord):
 
                     notehead_style = "open" if dur and int(dur) <= 2 else "filled"
 
+                    # Square symbols take their colour from the pitch class
+                    notehead_use["class"] = pitch_class(pitch)
+
                     if stem_direction == "up":
-                        notehead_use["xlink:href"] = f"#{pitch}-{notehead_style}-stem-up"
+                        notehead_use["xlink:href"] = f"#square-{notehead_style}-stem-up"
                     elif stem_direction == "down":
-                        notehead_use["xlink:href"] = f"#{pitch}-{notehead_style}-stem-down"
+                        notehead_use["xlink:href"] = f"#square-{notehead_style}-stem-down"
                     else:
-                        notehead_use["xlink:href"] = f"#{pitch}-{notehead_style}-no-stem"
+                        notehead_use["xlink:href"] = f"#square-{notehead_style}-no-stem"
                 else:
-                    notehead["fill"] = PITCH_COLORS[pitch]
+                    # Fill is inherited by the glyph from the <use>
+                    notehead_use = notehead.find("use")
+                    if notehead_use:
+                        notehead_use["class"] = pitch_class(pitch)
+                    else:
+                        notehead["fill"] = PITCH_COLORS[pitch]
+
                     notehead["stroke"] = "Black"
                     notehead["stroke-width"] = f"{STROKE_WIDTH}"
 
 
 def add_symbols_to_defs(defs):
-    """Add symbols to defs for Square Pitches - open/filled/stem up/stem down/no stem"""
+    """Add symbols to defs for Square Pitches - open/filled/stem up/stem down/no stem.
+
+    The outer square has no fill of its own, it inherits the pitch class fill of the notehead using it.
+    """
     # Define base widths for squares, these will be scaled up horizontally depending on stem
     outer_base_width = 240
     inner_base_width = 100
 
-    # Stem Down
-    for square_pitch in SQUARE_PITCHES:
-        open_symbol_markup = f"""
-            <symbol id="{square_pitch}-open-stem-down" overflow="inherit" viewBox="0 0 1000 1000">
-                <rect height="{outer_base_width}" width="{outer_base_width * 1.25}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(0, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-                <rect height="{inner_base_width}" width="{inner_base_width * 1.25}" fill="White" transform="translate(85, -50)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-            </symbol>
-        """
-
-        filled_symbol_markup = f"""
-            <symbol id="{square_pitch}-filled-stem-down" overflow="inherit" viewBox="0 0 1000 1000">
-            <rect height="{outer_base_width}" width="{outer_base_width * 1.25}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(10, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-            </symbol>
-        """
-
-        # Parse the symbols and append it to <defs>
-        open_symbol_soup = BeautifulSoup(open_symbol_markup, "xml").symbol
-        filled_symbol_soup = BeautifulSoup(filled_symbol_markup, "xml").symbol
-
-        defs.append(open_symbol_soup)
-        defs.append(filled_symbol_soup)
-
-    # Stem Up
-    for square_pitch in SQUARE_PITCHES:
+    for stem, open_scale, open_offsets, filled_scale, filled_offset in [
+        ("stem-down", 1.25, (0, 85), 1.25, 10),
+        ("stem-up", 1.25, (5, 95), 1.25, 5),
+        ("no-stem", 1.65, (0, 115), 1.25, 10),
+    ]:
         open_symbol_markup = f"""
-            <symbol id="{square_pitch}-open-stem-up" overflow="inherit" viewBox="0 0 1000 1000">
-                <rect height="{outer_base_width}" width="{outer_base_width * 1.25}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(5, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-                <rect height="{inner_base_width}" width="{inner_base_width * 1.25}" fill="White" transform="translate(95, -50)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
+            <symbol id="square-open-{stem}" overflow="inherit" viewBox="0 0 1000 1000">
+                <rect height="{outer_base_width}" width="{outer_base_width * open_scale}" transform="translate({open_offsets[0]}, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
+                <rect height="{inner_base_width}" width="{inner_base_width * open_scale}" fill="White" transform="translate({open_offsets[1]}, -50)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
             </symbol>
         """
 
         filled_symbol_markup = f"""
-            <symbol id="{square_pitch}-filled-stem-up" overflow="inherit" viewBox="0 0 1000 1000">
-            <rect height="{outer_base_width}" width="{outer_base_width * 1.25}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(5, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
+            <symbol id="square-filled-{stem}" overflow="inherit" viewBox="0 0 1000 1000">
+            <rect height="{outer_base_width}" width="{outer_base_width * filled_scale}" transform="translate({filled_offset}, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
             </symbol>
         """
 
@@ -647,27 +853,13 @@ def add_symbols_to_defs(defs):
         defs.append(open_symbol_soup)
         defs.append(filled_symbol_soup)
 
-    # No Stem
-    for square_pitch in SQUARE_PITCHES:
-        open_symbol_markup = f"""
-            <symbol id="{square_pitch}-open-no-stem" overflow="inherit" viewBox="0 0 1000 1000">
-                <rect height="{outer_base_width}" width="{outer_base_width * 1.65}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(0, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-                <rect height="{inner_base_width}" width="{inner_base_width * 1.65}" fill="White" transform="translate(115, -50)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-            </symbol>
-        """
-
-        filled_symbol_markup = f"""
-            <symbol id="{square_pitch}-filled-no-stem" overflow="inherit" viewBox="0 0 1000 1000">
-            <rect height="{outer_base_width}" width="{outer_base_width * 1.25}" fill="{PITCH_COLORS[square_pitch]}" transform="translate(10, -120)" stroke="Black" stroke-width="{STROKE_WIDTH}"/>
-            </symbol>
-        """
 
-        # Parse the symbols and append it to <defs>
-        open_symbol_soup = BeautifulSoup(open_symbol_markup, "xml").symbol
-        filled_symbol_soup = BeautifulSoup(filled_symbol_markup, "xml").symbol
+def add_palette_style(svg):
+    """Add the palette <style> (pitch class colours as CSS variables), swappable by id"""
+    style = svg.new_tag("style", id=PALETTE_STYLE_ID, type="text/css")
+    style.string = palette_css()
 
-        defs.append(open_symbol_soup)
-        defs.append(filled_symbol_soup)
+    svg.find("svg").insert(0, style)
 
 
 def shift_svg_content(soup):
@@ -682,10 +874,8 @@ def shift_svg_content(soup):
         svg["height"] = str(int(svg["height"].replace("px", "")) + 180)
 
 
-def add_logo_and_title(soup, page_num, total_page_count, page_title, all_tunings):
-    """Create and Add ColorMusic Logo and Song Title"""
-    svg = soup.find("svg")
-    group = soup.new_tag("g", id="logo-group")
+def logo_defs_markup():
+    """ColorMusic logo (the 12 pitch shapes in a circle) as a <symbol> in its own <defs>"""
     x_offset, y_offset = 25, 25
     shape_opacity = 1.0
     shape_stroke_width = 0.2
@@ -693,12 +883,12 @@ def add_logo_and_title(soup, page_num, total_page_count, page_title, all_tunings
     radius = 15
     ratio = radius / 65
 
-    print(f"Ratio: {ratio}")
-
     shape_scale = 1.4
     square_width = 15 * ratio * shape_scale
     circle_radis = 8.5 * ratio * shape_scale
-    
+    style = f"stroke:black; stroke-width:{shape_stroke_width}; opacity:{shape_opacity}"
+
+    shapes = []
     for pitch, angle in [
         ("Ef", 0),
         ("D", 30),
@@ -713,30 +903,34 @@ def add_logo_and_title(soup, page_num, total_page_count, page_title, all_tunings
         ("F", 300),
         ("E", 330),
     ]:
+        cx = (radius * math.cos(math.radians(angle))) + x_offset
+        cy = -(radius * math.sin(math.radians(angle))) + y_offset
+
         if pitch in SQUARE_PITCHES:
-            x = (radius * math.cos(math.radians(angle))) + x_offset - (square_width / 2)
-            y = -(radius * math.sin(math.radians(angle))) + y_offset - (square_width / 2)
-            cx, cy = x + square_width / 2, y + square_width / 2
-            shape = soup.new_tag(
-                "rect",
-                x=x,
-                y=y,
-                width=square_width,
-                height=square_width,
-                fill=PITCH_COLORS[pitch],
-                transform=f"rotate({90 - angle} {cx} {cy})",
-                style=f"stroke:black; stroke-width:{shape_stroke_width}; opacity:{shape_opacity}",
+            x, y = cx - (square_width / 2), cy - (square_width / 2)
+            shapes.append(
+                f'<rect x="{x:.2f}" y="{y:.2f}" width="{square_width:.2f}" height="{square_width:.2f}" '
+                f'class="{pitch_class(pitch)}" transform="rotate({90 - angle} {cx:.2f} {cy:.2f})" style="{style}"/>'
             )
         else:
-            shape = soup.new_tag(
-                "circle",
-                cx=(radius * math.cos(math.radians(angle))) + x_offset,
-                cy=-(radius * math.sin(math.radians(angle))) + y_offset,
-                r=circle_radis,
-                fill=PITCH_COLORS[pitch],
-                style=f"stroke:black; stroke-width:{shape_stroke_width}; opacity:{shape_opacity}",
+            shapes.append(
+                f'<circle cx="{cx:.2f}" cy="{cy:.2f}" r="{circle_radis:.2f}" class="{pitch_class(pitch)}" '
+                f'style="{style}"/>'
             )
-        group.append(shape)
+
+    return (f'<defs id="{LOGO_DEFS_ID}"><symbol id="{LOGO_SYMBOL_ID}" viewBox="0 0 {LOGO_SIZE} {LOGO_SIZE}" '
+            f'overflow="visible">{"".join(shapes)}</symbol></defs>')
+
+
+# Built once per process: page headers reference the symbol, and a PDF document defines it once for all pages
+LOGO_DEFS = logo_defs_markup()
+
+
+def add_logo_and_title(soup, page_num, total_page_count, page_title, all_tunings):
+    """Add ColorMusic Logo (a <use> of the logo symbol, see page_header_svg) and Song Title"""
+    svg = soup.find("svg")
+    group = soup.new_tag("g", id="logo-group")
+    group.append(soup.new_tag("use", width=LOGO_SIZE, height=LOGO_SIZE, **{"xlink:href": f"#{LOGO_SYMBOL_ID}"}))
 
     # # Text
     # color = soup.new_tag("text", x="55", y="35", fill="#FDB813", **{"font-size": "20"})
@@ -855,134 +1049,427 @@ def extract_score_title(soup):
     return score_title
 
 
-def render(filename, mei_data, title, bucket, render_id):
-    """Render MEI to ColorMusic"""
-    log_analytics_event(
-        "render_start",
-        render_id=render_id,
-        title=title,
-        filename=filename,
-    )
-    
-    # Label notes in MEI
-    soup = parse_mei(mei_data)
-    mei_data, all_tunings = label_notes(soup)
+def normalize_ids(svg_markup, source_ids, generated_ids):
+    """Rename the ids Verovio generated (not from the input MEI) in a page SVG, and the references to them.
+
+    generated_ids (Verovio id -> normalized id) is shared by the pages of a render, so an id keeps its name
+    across pages and new ones continue the numbering.
+    """
+    for element_id in SVG_ID_RE.findall(svg_markup):
+        if element_id in source_ids:
+            continue
+
+        glyph = GLYPH_SYMBOL_ID_RE.match(element_id)
+        token = glyph.group(1) if glyph else element_id
+
+        if token not in generated_ids:
+            normalized_id = f"{NORMALIZED_ID_PREFIX}{len(generated_ids)}"
+            while normalized_id in source_ids:
+                normalized_id = f"{normalized_id}x"
+
+            generated_ids[token] = normalized_id
+
+    def rename_token(match):
+        return generated_ids.get(match.group(), match.group())
+
+    def rename_attribute(match):
+        name, value = match.groups()
+
+        if name in ID_REFERENCE_ATTRIBUTES:
+            value = GENERATED_ID_TOKEN_RE.sub(rename_token, value)
+        elif "url(#" in value:
+            value = URL_REF_RE.sub(lambda url: f"url(#{generated_ids.get(url.group(1), url.group(1))})", value)
+
+        return f'{name}="{value}"'
+
+    def rename_selectors(match):
+        css = STYLE_ID_SELECTOR_RE.sub(lambda selector: f"#{generated_ids.get(selector.group(1), selector.group(1))}",
+                                       match.group(2))
+
+        return match.group(1) + css + match.group(3)
+
+    svg_markup = SVG_TAG_RE.sub(lambda match: SVG_ATTRIBUTE_RE.sub(rename_attribute, match.group()), svg_markup)
+
+    return sort_defs(SVG_STYLE_RE.sub(rename_selectors, svg_markup))
+
+
+def sort_defs(svg_markup):
+    """Order the <symbol>s in a page's <defs> by id, left as is if the <defs> holds anything else"""
+    def sort_symbols(match):
+        if DEFS_SYMBOL_RE.sub("", match.group(2)).strip():
+            return match.group()
+
+        ordered = sorted(DEFS_SYMBOL_RE.finditer(match.group(2)), key=lambda symbol: symbol.group(1))
+
+        return match.group(1) + "".join(symbol.group() for symbol in ordered) + match.group(3)
+
+    return DEFS_RE.sub(sort_symbols, svg_markup, count=1)
+
 
-    mei_data = str(mei_data)
+def colorize_svg(original_svg, soup):
+    """Transform a Verovio page SVG to ColorMusic-style, returns the modified SVG soup (without the header)"""
+    svg = BeautifulSoup(original_svg, "xml")
 
-    score_title = extract_score_title(soup)
+    add_symbols_to_defs(svg.find("defs"))
+    add_palette_style(svg)
+    # shift_svg_content(svg)
 
-    # User provided title overrides score title pulled from MEI
-    if not title and score_title:
-        title = score_title
+    for note in svg.find_all(class_="note"):
+        render_note_to_colormusic(soup, note, note.find_parent("g", class_="chord"))
+        reorder_note(note)
 
-    if not title:
-        title = "Unknown"
+    # Adjust opacity for visible accids
+    for accid in svg.find_all(class_="accid"):
+        accid["opacity"] = 0.5
+
+    # Footer
+    footer = svg.new_tag("comment")
+    footer.string = """
+        Generated and modified using the following libraries:
+        - BeautifulSoup: For parsing and manipulating the SVG.
+        - Verovio: For rendering MEI files to SVG. Visit Verovio at https://www.verovio.org
+    """
+    svg.find("svg").append(footer)
+
+    return svg
+
+
+def page_header_svg(page, total_page_count, title, all_tunings):
+    """Header overlay of a page (title, and logo and tunings on page 1) as a standalone SVG"""
+    header = BeautifulSoup(HEADER_SVG, "xml")
+    add_logo_and_title(header, page, total_page_count, title, all_tunings)
+    header_svg = str(header)
+
+    # The logo (page 1 only) needs its symbol, added as the prebuilt markup
+    if page == 1:
+        header_start = SVG_OPEN_TAG_RE.search(header_svg).end()
+        header_svg = f"{header_svg[:header_start]}{LOGO_DEFS}{header_svg[header_start:]}"
+
+    return header_svg
+
+
+def compose_page(body_svg, header_svg):
+    """Page SVG with its header overlay, the header's elements placed first inside the page's root <svg>"""
+    header_start = SVG_OPEN_TAG_RE.search(header_svg).end()
+    header_contents = header_svg[header_start:header_svg.rindex("</svg>")]
+
+    body_start = SVG_OPEN_TAG_RE.search(body_svg).end()
+
+    return f"{body_svg[:body_start]}{header_contents}{body_svg[body_start:]}"
+
+
+def load_page_svgs(bucket, manifest, timer, header_svgs=None):
+    """Stored pages of a render with their headers overlaid, in page order.
+
+    header_svgs ({page: header SVG}) overrides the stored headers.  Renders that predate header overlays have
+    the header in the page itself.
+    """
+    pages = sorted((artifact for artifact in manifest["artifacts"] if artifact["kind"] == "colormusic_svg"),
+                   key=lambda artifact: artifact["page"])
+    headers = {artifact["page"]: artifact for artifact in manifest["artifacts"]
+               if artifact["kind"] == "colormusic_header"}
+    header_svgs = header_svgs or {}
+    page_svgs = []
+
+    with timer.span("download"):
+        for artifact in pages:
+            body_svg = bucket.blob(artifact["name"]).download_as_text(encoding="utf-8")
+            header_svg = header_svgs.get(artifact["page"])
+
+            if header_svg is None and artifact["page"] in headers:
+                header_svg = bucket.blob(headers[artifact["page"]]["name"]).download_as_text(encoding="utf-8")
+
+            page_svgs.append(compose_page(body_svg, header_svg) if header_svg else body_svg)
+
+    return page_svgs
+
+
+def page_html(svg_markup):
+    """Wrap a page SVG for an HTML document, one page per printed sheet"""
+    return f"<div style='page-break-after: always'>{svg_markup}</div>"
+
+
+def pdf_document(page_svgs, shared=PDF_SHARED_DEFS):
+    """HTML document printing one page SVG per Letter sheet.
+
+    With shared, definitions repeated on every page (glyphs, square noteheads, logo) are defined once for the
+    document (see shared_defs), otherwise only the logo symbol is.
+    """
+    if shared:
+        shared_defs, page_svgs = share_defs(page_svgs)
+    elif any(LOGO_DEFS in svg_markup for svg_markup in page_svgs):
+        page_svgs = [svg_markup.replace(LOGO_DEFS, "") for svg_markup in page_svgs]
+        shared_defs = f"<svg width='0' height='0' style='position: absolute'>{LOGO_DEFS}</svg>"
+    else:
+        shared_defs = ""
+
+    return f"""
+        <html>
+          <head>
+            <style>
+              @page {{ size: Letter; margin: 0 }}
+              body {{ margin: 0 }}
+            </style>
+          </head>
+          <body>
+            {shared_defs}
+            {''.join(page_html(svg_markup) for svg_markup in page_svgs)}
+          </body>
+        </html>
+        """
+
+
+def generate_pdf_artifact(bucket, manifest, filename, page_svgs, timer):
+    """Print the pages to PDF with the persistent Chromium (launched at startup or on first use) and upload it"""
+    pdf_started = time.perf_counter()
+
+    with BROWSER_IN_USE.track_inprogress(), timer.span("pdf"):
+        pdf_bytes = pdf_backend.html_to_pdf(pdf_document(page_svgs))
+
+    upload_artifact(bucket, manifest, f"{filename}-colormusic.pdf", pdf_bytes, "pdf",
+                    content_type="application/pdf", started=pdf_started, timer=timer)
+
+
+def render_pdf(bucket, render_id, timer=None):
+    """Generate the PDF for a render made with generate_pdf=False, from its stored pages.
+
+    Returns the manifest's pdf artifact entry (existing or new), None if there is no manifest for render_id.
+    """
+    if timer is None:
+        timer = StageTimer()
+
+    def add_pdf(manifest):
+        for artifact in manifest["artifacts"]:
+            if artifact["kind"] == "pdf":
+                return (artifact, None), False
+
+        page_svgs = load_page_svgs(bucket, manifest, timer)
+
+        filename = manifest["source_filename"].rsplit(".", 1)[0]
+        generate_pdf_artifact(bucket, manifest, filename, page_svgs, timer)
+
+        return (manifest["artifacts"][-1], len(page_svgs)), True
+
+    result = update_manifest(bucket, render_id, add_pdf, timer)
+
+    if result is None:
+        return None
+
+    artifact, page_count = result
+
+    if page_count is not None:
+        log_analytics_event(
+            "pdf_complete",
+            render_id=render_id,
+            page_count=page_count,
+            stages=timer.summary(),
+        )
+
+    return artifact
+
+
+def retitle(bucket, render_id, title, timer=None):
+    """Change the title of a render: regenerates the page headers, and the PDF if it has one, not the pages.
+
+    Returns the updated manifest, None if there is no manifest for render_id.  Raises ValueError for renders
+    that predate header overlays (their title is part of the pages).
+    """
+    if timer is None:
+        timer = StageTimer()
+
+    def change_title(manifest):
+        header = manifest.get("header")
+
+        if header is None:
+            raise ValueError(f"Render {render_id} has its header in the pages, "
+                             "it has to be re-rendered to change title")
+
+        header["title"] = title
+        header["revision"] += 1
+        manifest["title"] = title
+
+        had_pdf = any(artifact["kind"] == "pdf" for artifact in manifest["artifacts"])
+        pages = sorted(artifact["page"] for artifact in manifest["artifacts"] if artifact["kind"] == "colormusic_svg")
+        manifest["artifacts"] = [artifact for artifact in manifest["artifacts"]
+                                 if artifact["kind"] not in ["colormusic_header", "pdf"]]
+
+        filename = manifest["source_filename"].rsplit(".", 1)[0]
+        header_svgs = {}
+
+        for page in pages:
+            with timer.span("transform_svg"):
+                header_svgs[page] = page_header_svg(page, header["page_count"], title, header["tunings"])
+
+            upload_artifact(bucket, manifest, f"{filename}-{page}-header.svg", header_svgs[page], "colormusic_header",
+                            page=page, content_type="image/svg+xml", timer=timer)
+
+        # A PDF that was deferred stays deferred, /render-pdf prints it with the new headers
+        if had_pdf:
+            generate_pdf_artifact(bucket, manifest, filename, load_page_svgs(bucket, manifest, timer, header_svgs),
+                                  timer)
+
+        return (manifest, len(pages), had_pdf), True
+
+    result = update_manifest(bucket, render_id, change_title, timer)
+
+    if result is None:
+        return None
+
+    manifest, page_count, had_pdf = result
 
     log_analytics_event(
-        "score_title",
+        "retitle_complete",
         render_id=render_id,
         title=title,
-        filename=filename,
+        revision=manifest["header"]["revision"],
+        page_count=page_count,
+        pdf=had_pdf,
+        stages=timer.summary(),
     )
 
-    filename = filename.rsplit(".", 1)[0]
-    
-    tk.setOptions({
-        "pageWidth": 2159,    # 210 mm * 10
-        "pageHeight": 2794,   # 297 mm * 10
-        "scale": 40,          # default is 40, adjust if needed (higher = bigger)
-        "adjustPageHeight": True,  # Automatically adjust page height to content
-        "svgViewBox": True,
-    })
+    return manifest
 
-    tk.loadData(mei_data)
 
-    svg_filenames = []
-    svg_html_parts = []
-    total_page_count = tk.getPageCount()
-    for page in range(1, min(total_page_count, PAGE_LIMIT) + 1):
-        svg = BeautifulSoup(tk.renderToSVG(page), "xml")
-        
-        # Load original for reference
-        blob = bucket.blob(f"{render_id}/{filename}-{page}-original.svg")
-        blob.upload_from_string(tk.renderToSVG(page))
+def render(filename, mei_data, title, bucket, render_id, timer=None, profile=False, generate_pdf=True):
+    """Render MEI to ColorMusic, returns the preview page SVGs.  Stage timings are recorded to timer (if provided).
 
-        add_symbols_to_defs(svg.find("defs"))
-        # shift_svg_content(svg)
+    With profile set the render runs under cProfile and the profile is stored next to the SVGs.
+    """
+    render_started = time.perf_counter()
 
-        for note in svg.find_all(class_="note"):
-            render_note_to_colormusic(soup, note, note.find_parent("g", class_="chord"))
-            reorder_note(note)
+    if timer is None:
+        timer = StageTimer()
 
-        # Adjust opacity for visible accids
-        for accid in svg.find_all(class_="accid"):
-            accid["opacity"] = 0.5
+    profiler = start_profiler() if profile else None
 
-        add_logo_and_title(svg, page, total_page_count, title, all_tunings)
+    # Always stop the profiler, an exception would otherwise leave this worker thread profiled
+    try:
+        log_analytics_event(
+            "render_start",
+            render_id=render_id,
+            title=title,
+            filename=filename,
+        )
 
-        # Footer
-        footer = svg.new_tag("comment")
-        footer.string = """
-            Generated and modified using the following libraries:
-            - BeautifulSoup: For parsing and manipulating the SVG.
-            - Verovio: For rendering MEI files to SVG. Visit Verovio at https://www.verovio.org
-        """
-        svg.find("svg").append(footer)
-        
-        svg_filename = f"{filename}-{page}-colormusic.svg"
-        blob = bucket.blob(f"{render_id}/{svg_filename}")
-        blob.upload_from_string(str(svg))
-        svg_html_parts.append(f"<div style='page-break-after: always'>{str(svg)}</div>")
-        
-        svg_filenames.append(svg_filename)
-
-    print("Rendered SVG filenames:")
-    for svg_filename in svg_filenames:
-        print(svg_filename)
-
-    # Generate PDF and upload to bucket
-    html_content = f"""
-    <html>
-      <head>
-        <style>
-          @page {{ size: Letter; margin: 0 }}
-          body {{ margin: 0 }}
-        </style>
-      </head>
-      <body>
-        {''.join(svg_html_parts)}
-      </body>
-    </html>
-    """
+        manifest = new_render_manifest(render_id, filename, title)
+
+        # Input MEI is already stored by the frontend, only record it
+        add_manifest_artifact(manifest, filename, mei_data, "mei", content_type="application/xml")
+    
+        # Label notes in MEI
+        with timer.span("parse_label"):
+            soup = parse_mei(mei_data)
+            mei_data, all_tunings = label_notes(soup)
+
+            mei_data = str(mei_data)
 
-    pdf_io = io.BytesIO()
+            score_title = extract_score_title(soup)
 
-    # Generate PDF using Playwright
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page()
-        page.set_content(html_content, wait_until="load")
+        # User provided title overrides score title pulled from MEI
+        if not title and score_title:
+            title = score_title
 
-        pdf_bytes = page.pdf(format="Letter", print_background=True)
-        browser.close()
+        if not title:
+            title = "Unknown"
 
-    # Write to in-memory buffer
-    pdf_io.write(pdf_bytes)
-    pdf_io.seek(0)  # Reset to start of buffer
+        log_analytics_event(
+            "score_title",
+            render_id=render_id,
+            title=title,
+            filename=filename,
+        )
 
-    # Upload to GCS
-    pdf_filename = f"{filename}-colormusic.pdf"
-    blob = bucket.blob(f"{render_id}/{pdf_filename}")
+        filename = filename.rsplit(".", 1)[0]
+        tk = get_toolkit()
+    
+        with TOOLKIT_IN_USE.track_inprogress(), timer.span("verovio_load"):
+            tk.setOptions({
+                "pageWidth": 2159,    # 210 mm * 10
+                "pageHeight": 2794,   # 297 mm * 10
+                "scale": 40,          # default is 40, adjust if needed (higher = bigger)
+                "adjustPageHeight": True,  # Automatically adjust page height to content
+                "svgViewBox": True,
+                "xmlIdChecksum": True,  # Ids seeded from the input, so the same score renders to the same bytes
+            })
+
+            tk.loadData(mei_data)
+
+        svg_filenames = []
+        page_svgs = []
+        steps = compact_steps()
+        source_ids = set(XML_ID_RE.findall(mei_data))
+        generated_ids = {}
+        total_page_count = tk.getPageCount()
+        for page in range(1, min(total_page_count, PAGE_LIMIT) + 1):
+            page_started = time.perf_counter()
+
+            with TOOLKIT_IN_USE.track_inprogress(), timer.span("render_svg"):
+                original_svg = normalize_ids(tk.renderToSVG(page), source_ids, generated_ids)
+        
+            # Load original for reference
+            upload_artifact(bucket, manifest, f"{filename}-{page}-original.svg", original_svg, "original_svg",
+                            page=page, content_type="image/svg+xml", started=page_started, timer=timer)
 
-    blob.upload_from_file(pdf_io, content_type="application/pdf")
+            with timer.span("transform_svg"):
+                svg = colorize_svg(original_svg, soup)
+                header_svg = page_header_svg(page, total_page_count, title, all_tunings)
+        
+            # Serialize once, the same body is uploaded, and returned and printed to PDF with its header
+            svg_markup = str(svg)
+            uncompacted_size = len(svg_markup.encode("utf-8"))
+
+            with timer.span("compact_svg"):
+                svg_markup = compact_svg(svg_markup, steps, class_prefix=page_class_prefix(page))
+
+            svg_filename = f"{filename}-{page}-colormusic.svg"
+            upload_artifact(bucket, manifest, svg_filename, svg_markup, "colormusic_svg",
+                            page=page, content_type="image/svg+xml", started=page_started, timer=timer,
+                            uncompacted_size=uncompacted_size)
+            upload_artifact(bucket, manifest, f"{filename}-{page}-header.svg", header_svg, "colormusic_header",
+                            page=page, content_type="image/svg+xml", timer=timer)
+            page_svgs.append(compose_page(svg_markup, header_svg))
+        
+            svg_filenames.append(svg_filename)
+
+        print("Rendered SVG filenames:")
+        for svg_filename in svg_filenames:
+            print(svg_filename)
+
+        if generate_pdf:
+            generate_pdf_artifact(bucket, manifest, filename, page_svgs, timer)
+
+        manifest["title"] = title
+        manifest["page_count"] = len(svg_filenames)
+        manifest["header"] = {
+            "title": title,
+            "page_count": total_page_count,
+            "tunings": all_tunings,
+            "revision": 0,
+        }
+        manifest["render_ms"] = round((time.perf_counter() - render_started) * 1000, 2)
+        manifest["stages"] = timer.summary()
+        manifest["svg_compaction"] = svg_compaction_summary(manifest, steps)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    if profiler is not None:
+        for profile_filename, data, content_type in profile_artifacts(profiler, timer):
+            upload_artifact(bucket, manifest, profile_filename, data, "profile", content_type=content_type)
+
+    with timer.span("upload"):
+        upload_manifest(bucket, manifest)
 
     log_analytics_event(
         "render_complete",
         render_id=render_id,
         title=title,
         filename=filename,
+        page_count=len(svg_filenames),
+        render_ms=manifest["render_ms"],
+        svg_compaction=manifest["svg_compaction"],
+        stages=timer.summary(),
     )
 
-    # return svg_filenames
-    return svg_html_parts[:1]
+    # Preview is the first page only
+    return page_svgs[:1]
@@ -0,0 +1,103 @@
+# Standard Libraries
+import os
+import re
+
+# Third-party Libraries
+from lxml import etree
+
+from .compact import HOISTED_CLASS_PREFIX, SVG_NS, XLINK_HREF
+
+# PDF documents define identical page <defs> (Verovio glyphs, square noteheads, logo) once in a hidden SVG
+PDF_SHARED_DEFS = os.getenv("PDF_SHARED_DEFS", "1") == "1"
+
+SHARED_DEFS_ID = "cm-shared-defs"
+PAGE_ID_SUFFIX = "-p"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+URL_REF_RE = re.compile(r"url\(#([^)]+)\)")
+
+# Classes from compaction's attribute hoisting (cm-s<page>-<n>, cm-s<n> before per page numbering)
+HOISTED_CLASS_RE = re.compile(rf"^{HOISTED_CLASS_PREFIX}\d")
+
+
+def definitions(root):
+    """Top level definitions (children of <defs> with an id) of a page"""
+    return [definition for defs in root.iter(f"{{{SVG_NS}}}defs") for definition in defs
+            if isinstance(definition.tag, str) and definition.get("id") is not None]
+
+
+def shareable(definition):
+    """Whether a definition renders the same outside its page: nothing in it uses the page's hoisted classes"""
+    return not any(HOISTED_CLASS_RE.match(class_name) for element in definition.iter(etree.Element)
+                   for class_name in (element.get("class") or "").split())
+
+
+def rename_ids(root, renames):
+    """Rename ids (old -> new) and rewrite references: href/xlink:href, url(#id) and #id in <style>"""
+    def replace_url(match):
+        return f"url(#{renames.get(match.group(1), match.group(1))})"
+
+    selector_re = re.compile("#(" + "|".join(map(re.escape, renames)) + r")(?![\w-])")
+
+    for element in root.iter(etree.Element):
+        if element.get("id") in renames:
+            element.set("id", renames[element.get("id")])
+
+        for attribute, value in element.attrib.items():
+            if attribute in [XLINK_HREF, "href"] and value[1:] in renames and value.startswith("#"):
+                element.set(attribute, f"#{renames[value[1:]]}")
+            elif "url(#" in value:
+                element.set(attribute, URL_REF_RE.sub(replace_url, value))
+
+        if element.tag == f"{{{SVG_NS}}}style" and element.text:
+            element.text = selector_re.sub(lambda match: f"#{renames[match.group(1)]}", element.text)
+
+
+def share_defs(page_svgs):
+    """Hoist page definitions into one shared SVG for a multi-page document.
+
+    Returns (shared SVG markup or "", page SVGs).  The first copy of each shareable definition moves to the
+    shared SVG and identical copies on later pages are dropped.  A definition whose id is already taken by a
+    different one earlier in the document is suffixed with its page number, along with the page's references
+    to it, so the pages still use their own once inlined together.
+    """
+    parser = etree.XMLParser(huge_tree=True)
+    shared = etree.Element(f"{{{SVG_NS}}}svg", nsmap={None: SVG_NS, "xlink": XLINK_NS}, id=SHARED_DEFS_ID,
+                           width="0", height="0", style="position: absolute")
+    shared_defs = etree.SubElement(shared, f"{{{SVG_NS}}}defs")
+    shared_markup = {}  # id -> markup of the shared definition
+    defined_ids = {SHARED_DEFS_ID}  # Definition ids in the document so far, shared or kept on their page
+    pages = []
+
+    for page, svg_markup in enumerate(page_svgs, start=1):
+        root = etree.fromstring(svg_markup.encode("utf-8"), parser=parser)
+        page_definitions = []
+
+        for definition in definitions(root):
+            if shared_markup.get(definition.get("id")) == etree.tostring(definition, with_tail=False):
+                definition.getparent().remove(definition)
+            else:
+                page_definitions.append(definition)
+
+        renames = {definition.get("id"): f"{definition.get('id')}{PAGE_ID_SUFFIX}{page}"
+                   for definition in page_definitions if definition.get("id") in defined_ids}
+        if renames:
+            rename_ids(root, renames)
+
+        for definition in page_definitions:
+            defined_ids.add(definition.get("id"))
+
+            if shareable(definition):
+                shared_markup[definition.get("id")] = etree.tostring(definition, with_tail=False)
+                shared_defs.append(definition)
+
+        for defs in list(root.iter(f"{{{SVG_NS}}}defs")):
+            if len(defs) == 0:
+                defs.getparent().remove(defs)
+
+        pages.append(etree.tostring(root, encoding="unicode"))
+
+    if len(shared_defs) == 0:
+        return "", pages
+
+    return etree.tostring(shared, encoding="unicode"), pages
@@ -0,0 +1,80 @@
+# Standard Libraries
+import os
+import threading
+import time
+import traceback
+
+from .analytics import log_analytics_event
+from .timing import StageTimer
+
+# Max time a request waits for warm-up to finish before rendering cold
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", 60))
+
+
+class Startup:
+    """Background warm-up of the service's heavy dependencies, with readiness and a timing breakdown.
+
+    Each step is a (stage, function) pair run in order on a background thread, so the server accepts
+    connections (and liveness checks) immediately while Verovio and Chromium load.
+    """
+    def __init__(self):
+        self.timer = StageTimer()
+        self.status = "starting"
+        self.error = None
+        self.done = threading.Event()
+
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def start(self, steps, import_ms=None):
+        if import_ms is not None:
+            self.timer.record("import", import_ms)
+
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="startup-warm-up", daemon=True)
+        self._thread.start()
+
+    def _run(self, steps):
+        started = time.perf_counter()
+
+        try:
+            for stage, step in steps:
+                with self.timer.span(stage):
+                    step()
+
+            self.status = "ready"
+        except Exception as e:
+            self.status = "error"
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Warm-up failed: {traceback.format_exc()}")
+        finally:
+            self.done.set()
+
+        breakdown = self.breakdown()
+        warm_up_ms = round((time.perf_counter() - started) * 1000, 2)
+        print(f"Startup {self.status} after {warm_up_ms}ms warm-up: {breakdown}")
+
+        log_analytics_event(
+            "startup_timing",
+            severity="INFO" if self.ready else "ERROR",
+            status=self.status,
+            error=self.error,
+            warm_up_ms=warm_up_ms,
+            stages=breakdown,
+        )
+
+    def breakdown(self):
+        """{stage: ms} in the order stages ran"""
+        return {stage: round(ms, 2) for stage, ms in self.timer.spans}
+
+    def wait(self, timeout=STARTUP_WAIT_SECONDS):
+        """Block until warm-up has finished (ready or not), True if ready"""
+        if self._thread is not None:
+            self.done.wait(timeout)
+
+        return self.ready
+
+
+startup = Startup()
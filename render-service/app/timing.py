@@ -0,0 +1,54 @@
+# Standard Libraries
+from contextlib import contextmanager
+import re
+import time
+
+
+class StageTimer:
+    """Collect named timing spans (ex. per page, per upload) for a single request"""
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name, duration_ms):
+        self.spans.append((name, duration_ms))
+
+    def summary(self):
+        """Aggregate spans by stage name, {name: {"count", "total_ms", "max_ms"}} in first seen order"""
+        stages = {}
+
+        for name, duration_ms in self.spans:
+            stage = stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] += duration_ms
+            stage["max_ms"] = max(stage["max_ms"], duration_ms)
+
+        for stage in stages.values():
+            stage["total_ms"] = round(stage["total_ms"], 2)
+            stage["max_ms"] = round(stage["max_ms"], 2)
+
+        return stages
+
+    def server_timing(self, prefix=""):
+        """Format the aggregated stages as a Server-Timing header value"""
+        return ", ".join(
+            f'{prefix}{name};dur={stage["total_ms"]};desc="x{stage["count"]}"'
+            for name, stage in self.summary().items()
+        )
+
+
+def prefix_server_timing(header_value, prefix):
+    """Prefix metric names of a downstream Server-Timing header, so they can be merged into our own"""
+    if not header_value:
+        return ""
+
+    return ", ".join(
+        re.sub(r"^\s*", prefix, metric, count=1) for metric in header_value.split(",") if metric.strip()
+    )
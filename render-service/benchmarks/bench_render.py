@@ -0,0 +1,260 @@
+"""Benchmark the render pipeline over the prototype/tests score corpus.
+
+Each score goes through render() against local filesystem storage, timing label_notes, Verovio layout,
+per page colorization, storage uploads and PDF export.  Each score runs in a fresh process (warmed up
+first, like the service) so its peak RSS is its own.  Results are saved as JSON and can be compared
+against a stored baseline, exiting non-zero when a stage regresses beyond the threshold.
+
+Usage (from render-service/):
+    python benchmarks/bench_render.py --save-baseline
+    python benchmarks/bench_render.py --baseline benchmarks/baseline.json --threshold 0.2
+    python benchmarks/bench_render.py --skip-pdf --scores Creep MadWorld --repeat 5
+    python benchmarks/bench_render.py --skip-pdf --no-corpus --synthetic 16 64 256 --repeat 1
+"""
+# Standard Libraries
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import math
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_BASELINE = os.path.join(SERVICE_DIR, "benchmarks", "baseline.json")
+DEFAULT_OUTPUT = "bench_results.json"
+
+# Stages reported per score, in pipeline order
+STAGES = ["parse_label", "verovio_load", "render_svg", "transform_svg", "compact_svg", "upload", "pdf", ]
+
+# Ignore regressions smaller than this, sub-millisecond stages are mostly noise
+MIN_REGRESSION_MS = 5.0
+
+sys.path.insert(0, SERVICE_DIR)
+
+# Keep benchmark runs off Cloud Logging
+os.environ.setdefault("ANALYTICS_SINK", "jsonl")
+os.environ.setdefault("ANALYTICS_JSONL_PATH", os.path.join(tempfile.gettempdir(), "colormusic-bench-analytics.jsonl"))
+
+import verovio
+
+from app.local_storage import LocalStorageClient
+from app.pdf import pdf_backend
+from app.renderer import render, warm_toolkit
+from app.timing import StageTimer
+from benchmarks.corpus import CORPUS_DIR, load_corpus, load_scores, synthetic_scores
+
+
+def peak_rss_mb():
+    """Process high-water mark RSS in MB (ru_maxrss is KB on Linux, bytes on macOS), per score as each has a process"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_score(name, mei_data, bucket, repeat, generate_pdf):
+    """Render one score repeat times, returns median per stage timings and throughput"""
+    note_count = len(re.findall(r"<note[\s>]", mei_data))
+    runs = []
+
+    for run in range(repeat):
+        timer = StageTimer()
+        started = time.perf_counter()
+
+        render(f"{name}.mei", mei_data, name, bucket, f"bench-{name}-{run}", timer=timer, generate_pdf=generate_pdf)
+
+        runs.append({
+            "total_ms": (time.perf_counter() - started) * 1000,
+            "summary": timer.summary(),
+        })
+
+    page_count = runs[0]["summary"]["render_svg"]["count"]
+    total_ms = statistics.median(run["total_ms"] for run in runs)
+
+    stages_ms = {}
+    for stage in STAGES:
+        if stage in runs[0]["summary"]:
+            stages_ms[stage] = round(statistics.median(run["summary"][stage]["total_ms"] for run in runs), 2)
+
+    return {
+        "notes": note_count,
+        "pages": page_count,
+        "total_ms": round(total_ms, 2),
+        "stages_ms": stages_ms,
+        "notes_per_sec": round(note_count / (total_ms / 1000), 1),
+        "pages_per_sec": round(page_count / (total_ms / 1000), 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_score_worker(name, mei_data, storage_root, repeat, generate_pdf):
+    """bench_score in a fresh process, warmed up as the service is at startup so timings match a long-lived worker"""
+    warm_toolkit()
+
+    if generate_pdf:
+        pdf_backend.start()
+
+    return bench_score(name, mei_data, LocalStorageClient(storage_root).bucket("bench"), repeat, generate_pdf)
+
+
+def bench_score_isolated(name, mei_data, storage_root, repeat, generate_pdf):
+    """Run bench_score_worker in its own process, ru_maxrss is a process high-water mark"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(bench_score_worker, name, mei_data, storage_root, repeat, generate_pdf).result()
+
+
+def run_benchmark(scores, repeat, generate_pdf):
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "verovio": verovio.toolkit().getVersion(),
+            "repeat": repeat,
+            "pdf": generate_pdf,
+        },
+        "scores": {},
+    }
+
+    with tempfile.TemporaryDirectory() as storage_root:
+        for name, mei_data in scores:
+            results["scores"][name] = bench_score_isolated(name, mei_data, storage_root, repeat, generate_pdf)
+            print_score(name, results["scores"][name])
+
+    total_ms = sum(score["total_ms"] for score in results["scores"].values())
+    results["totals"] = {
+        "total_ms": round(total_ms, 2),
+        "notes_per_sec": round(sum(score["notes"] for score in results["scores"].values()) / (total_ms / 1000), 1),
+        "pages_per_sec": round(sum(score["pages"] for score in results["scores"].values()) / (total_ms / 1000), 3),
+        "peak_rss_mb": max(score["peak_rss_mb"] for score in results["scores"].values()),
+    }
+
+    return results
+
+
+def print_score(name, score):
+    stages = "  ".join(f"{stage}={ms:.0f}" for stage, ms in score["stages_ms"].items())
+    print(
+        f"{name:<28} pages={score['pages']:<3} notes={score['notes']:<5} total={score['total_ms']:>9.1f}ms  "
+        f"{score['notes_per_sec']:>8.1f} notes/s  {score['pages_per_sec']:>6.2f} pages/s  "
+        f"rss={score['peak_rss_mb']}MB\n    {stages}"
+    )
+
+
+def scaling_exponents(results, names):
+    """Per stage log-log slope between consecutive scores by note count, ~1 is linear and >1.2 is superlinear"""
+    scores = sorted((results["scores"][name] for name in names), key=lambda score: score["notes"])
+    exponents = []
+
+    for smaller, larger in zip(scores, scores[1:]):
+        stages = dict(smaller["stages_ms"], total=smaller["total_ms"])
+        larger_stages = dict(larger["stages_ms"], total=larger["total_ms"])
+        note_ratio = math.log(larger["notes"] / smaller["notes"])
+
+        slopes = {}
+        for stage, ms in stages.items():
+            if ms > 0 and larger_stages.get(stage, 0) > 0 and note_ratio > 0:
+                slopes[stage] = round(math.log(larger_stages[stage] / ms) / note_ratio, 2)
+
+        exponents.append((smaller["notes"], larger["notes"], slopes))
+
+    return exponents
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """[(score, stage, baseline_ms, current_ms)] for stages slower than baseline by more than threshold"""
+    regressions = []
+
+    for name, score in results["scores"].items():
+        baseline_score = baseline["scores"].get(name)
+
+        if baseline_score is None:
+            continue
+
+        stages = dict(score["stages_ms"], total=score["total_ms"])
+        baseline_stages = dict(baseline_score["stages_ms"], total=baseline_score["total_ms"])
+
+        for stage, current_ms in stages.items():
+            baseline_ms = baseline_stages.get(stage)
+
+            if baseline_ms is None:
+                continue
+
+            if current_ms > baseline_ms * (1 + threshold) and current_ms - baseline_ms > MIN_REGRESSION_MS:
+                regressions.append((name, stage, baseline_ms, current_ms))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline over the score corpus")
+    parser.add_argument("--scores", nargs="*", help="Score names to run (ex. Creep), default all")
+    parser.add_argument("--no-corpus", action="store_true", help="Only run synthetic scores")
+    parser.add_argument("--synthetic", nargs="*", type=int, default=[],
+                        help="Also run generated scores with these measure counts (ex. 16 64 256)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per score, medians are reported")
+    parser.add_argument("--skip-pdf", action="store_true", help="Skip PDF export (no Chromium available)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to save results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown per stage (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    # Timings are machine specific, so no baseline is committed; without one there is nothing to fail against
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"No baseline at {args.baseline}, record one on this machine with --save-baseline")
+
+    scores = [] if args.no_corpus else load_scores(load_corpus(args.scores))
+    synthetic = synthetic_scores(args.synthetic)
+    scores += synthetic
+
+    if not scores:
+        parser.error(f"No scores found in {CORPUS_DIR}")
+
+    results = run_benchmark(scores, args.repeat, generate_pdf=not args.skip_pdf)
+
+    if len(synthetic) > 1:
+        results["scaling"] = scaling_exponents(results, [name for name, _ in synthetic])
+
+        print("\nScaling exponents (log-log slope of stage time vs notes, >1.2 is superlinear)")
+        for smaller_notes, larger_notes, slopes in results["scaling"]:
+            print(f"    {smaller_notes} -> {larger_notes} notes: "
+                  + "  ".join(f"{stage}={slope}" for stage, slope in slopes.items()))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nTotal {results['totals']['total_ms']:.1f}ms, {results['totals']['notes_per_sec']} notes/s, "
+          f"{results['totals']['pages_per_sec']} pages/s, peak RSS {results['totals']['peak_rss_mb']}MB")
+    print(f"Results saved to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+
+    for name, stage, baseline_ms, current_ms in regressions:
+        print(f"REGRESSION {name} {stage}: {baseline_ms:.1f}ms -> {current_ms:.1f}ms "
+              f"(+{(current_ms / baseline_ms - 1) * 100:.0f}%)")
+
+    if regressions:
+        sys.exit(1)
+
+    print(f"No stage regressed more than {args.threshold * 100:.0f}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
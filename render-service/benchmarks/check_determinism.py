@@ -0,0 +1,106 @@
+"""Determinism check for the render pipeline.
+
+Renders each score alone in a fresh process, then all of them one after another in a single process (in order
+and reversed), and fails if any page SVG (original, ColorMusic or header) differs from the score rendered alone.
+Catches output that depends on what the process rendered before, such as Verovio's generated ids or glyph order.
+
+Usage (from render-service/):
+    python benchmarks/check_determinism.py
+    python benchmarks/check_determinism.py --scores MadWorld Creep --synthetic 16
+"""
+# Standard Libraries
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import tempfile
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Artifacts compared, the PDF embeds its creation date
+PAGE_KINDS = ["original_svg", "colormusic_svg", "colormusic_header"]
+
+sys.path.insert(0, SERVICE_DIR)
+
+# Keep check runs off Cloud Logging
+os.environ.setdefault("ANALYTICS_SINK", "jsonl")
+os.environ.setdefault("ANALYTICS_JSONL_PATH", os.path.join(tempfile.gettempdir(), "colormusic-check-analytics.jsonl"))
+
+from app.local_storage import LocalStorageClient
+from app.renderer import load_manifest, render, warm_toolkit
+from benchmarks.corpus import load_corpus, load_scores, synthetic_scores
+
+
+def render_hashes_worker(scores):
+    """Render scores in order in this (fresh) process, returns {name: {artifact filename: sha256}}"""
+    warm_toolkit()
+    hashes = {}
+
+    with tempfile.TemporaryDirectory(prefix="colormusic-check-") as storage_root:
+        bucket = LocalStorageClient(storage_root).bucket("check")
+
+        for name, mei_data in scores:
+            render_id = f"check-{name}"
+            render(f"{name}.mei", mei_data, name, bucket, render_id, generate_pdf=False)
+
+            hashes[name] = {
+                artifact["name"].removeprefix(f"{render_id}/"): artifact["sha256"]
+                for artifact in load_manifest(bucket, render_id)["artifacts"] if artifact["kind"] in PAGE_KINDS
+            }
+
+    return hashes
+
+
+def render_hashes(scores):
+    """render_hashes_worker in a fresh spawned process, so nothing carries over from earlier renders"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(render_hashes_worker, scores).result()
+
+
+def compare(label, hashes, alone):
+    """Print a FAIL line per artifact that differs from the score rendered alone, returns the number of them"""
+    failures = 0
+
+    for name, artifacts in hashes.items():
+        for artifact, sha256 in sorted(artifacts.items()):
+            if alone[name].get(artifact) != sha256:
+                print(f"FAIL {name} {artifact}: differs {label}")
+                failures += 1
+
+        for artifact in sorted(alone[name].keys() - artifacts.keys()):
+            print(f"FAIL {name} {artifact}: missing {label}")
+            failures += 1
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check page SVGs don't depend on what the process rendered before")
+    parser.add_argument("--scores", nargs="*", help="Corpus score names (default: all)")
+    parser.add_argument("--synthetic", nargs="*", type=int, default=[], help="Also check synthetic scores (measures)")
+    args = parser.parse_args()
+
+    scores = load_scores(load_corpus(args.scores)) + synthetic_scores(args.synthetic)
+    if len(scores) < 2:
+        print("Need at least two scores to render one after another")
+        sys.exit(2)
+
+    alone = {}
+    for score in scores:
+        alone.update(render_hashes([score]))
+
+    failures = 0
+    for label, ordered in [("in order", scores), ("reversed", scores[::-1])]:
+        hashes = render_hashes(ordered)
+        failures += compare(f"when rendered after other scores ({label})", hashes, alone)
+
+    artifact_count = sum(len(artifacts) for artifacts in alone.values())
+    print(f"{len(scores)} scores, {artifact_count} page artifacts compared, {failures} differ")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
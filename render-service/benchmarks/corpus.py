@@ -0,0 +1,53 @@
+"""Score inputs shared by the benchmark, differential check and load test (no app imports)."""
+# Standard Libraries
+import glob
+import os
+
+from benchmarks.generate_score import generate_mei
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "prototype", "tests")
+
+# Synthetic scores stress every label_notes path: chords, ties, key changes, tablature and odd measure numbers
+SYNTHETIC_PARAMS = {
+    "staves": 4,
+    "chords_per_beat": 2,
+    "tie_density": 0.2,
+    "key_change_every": 16,
+    "tab_staves": 1,
+    "non_numeric_every": 10,
+}
+
+
+def load_corpus(names=None):
+    """[(name, mei_path)] for each score in the corpus (the unmodified .mei, not -mod.mei)"""
+    corpus = []
+
+    for mei_path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*", "*.mei"))):
+        name = os.path.splitext(os.path.basename(mei_path))[0]
+
+        if name.endswith("-mod") or (names and name not in names):
+            continue
+
+        corpus.append((name, mei_path))
+
+    return corpus
+
+
+def load_scores(corpus):
+    """[(name, mei_data)] from load_corpus() entries"""
+    scores = []
+
+    for name, mei_path in corpus:
+        with open(mei_path, encoding="utf-8") as f:
+            scores.append((name, f.read()))
+
+    return scores
+
+
+def synthetic_scores(measure_counts, seed=0):
+    """[(name, mei_data)] of generated scores, one per measure count"""
+    return [
+        (f"synthetic-{measures}m", generate_mei(measures=measures, seed=seed, title=f"Synthetic {measures}",
+                                                **SYNTHETIC_PARAMS))
+        for measures in measure_counts
+    ]
@@ -0,0 +1,246 @@
+"""Differential check of two renderer engines over the score corpus.
+
+An engine is a function taking MEI text and returning the ColorMusic page SVGs (as strings).  Both engines
+render every score and the pages are compared semantically per note id: label, notehead symbol, fill
+colour (attribute or palette pitch class) and whether the notehead is drawn after the stem.  Serialization
+differences (whitespace, attribute order, generated glyph ids) are ignored.
+
+Usage (from render-service/):
+    python benchmarks/diff_engines.py --candidate mypackage.fast_renderer:render_pages
+    python benchmarks/diff_engines.py --baseline benchmarks.diff_engines:reference_engine \\
+        --candidate mypackage.fast_renderer:render_pages --mei path/to/extra.mei path/to/more_scores/
+    python benchmarks/diff_engines.py --candidate mypackage.fast_renderer:render_pages --synthetic 16 64
+"""
+# Standard Libraries
+import argparse
+import glob
+import importlib
+import os
+import re
+import sys
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+sys.path.insert(0, SERVICE_DIR)
+
+os.environ.setdefault("ANALYTICS_SINK", "stdout")
+
+# Third-party Libraries
+from bs4 import BeautifulSoup
+
+from app import renderer
+from benchmarks.corpus import load_corpus, load_scores, synthetic_scores
+
+REFERENCE_ENGINE = "benchmarks.diff_engines:reference_engine"
+
+# Verovio glyph symbol ids are "<SMuFL code>-<generated suffix>", only the code is meaningful
+GLYPH_ID_RE = re.compile(r"^#?([0-9A-F]{4})-")
+
+# Square notehead symbols were once one per pitch ("C-filled-stem-up"), now coloured by pitch class
+PITCH_SQUARE_ID_RE = re.compile(r"^#?(?:[A-G][sf]?-|square-)((?:open|filled)-(?:stem-up|stem-down|no-stem))$")
+
+PALETTE_VARIABLE_RE = re.compile(r"--(cm-pitch-[A-Za-z]+):\s*([^;}]+)")
+
+MAX_DIFFS_PER_SCORE = 20
+
+
+def reference_engine(mei_data):
+    """The production transform: label_notes, Verovio layout and colorize_svg per page (headers are overlaid apart).
+
+    Pages are compared before compaction, which drops the labelAttr titles the features are keyed on.
+    """
+    soup = renderer.parse_mei(mei_data)
+    labeled_soup, _ = renderer.label_notes(soup)
+
+    tk = renderer.get_toolkit()
+    tk.setOptions({
+        "pageWidth": 2159,
+        "pageHeight": 2794,
+        "scale": 40,
+        "adjustPageHeight": True,
+        "svgViewBox": True,
+        "xmlIdChecksum": True,
+    })
+    tk.loadData(str(labeled_soup))
+
+    total_page_count = tk.getPageCount()
+    source_ids = set(renderer.XML_ID_RE.findall(str(labeled_soup)))
+    generated_ids = {}
+
+    return [
+        str(renderer.colorize_svg(renderer.normalize_ids(tk.renderToSVG(page), source_ids, generated_ids), soup))
+        for page in range(1, min(total_page_count, renderer.PAGE_LIMIT) + 1)
+    ]
+
+
+def load_engine(spec):
+    """Import an engine from "module:function" """
+    module_name, function_name = spec.split(":")
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def normalize_href(href):
+    if href is None:
+        return None
+
+    glyph = GLYPH_ID_RE.match(href)
+    if glyph:
+        return f"glyph:{glyph.group(1)}"
+
+    square = PITCH_SQUARE_ID_RE.match(href)
+
+    return f"square:{square.group(1)}" if square else href
+
+
+def palette_fills(svg):
+    """Colour of each pitch class, by class name, from the palette <style>"""
+    style = svg.find("style", id=renderer.PALETTE_STYLE_ID)
+
+    return dict(PALETTE_VARIABLE_RE.findall(style.get_text())) if style else {}
+
+
+def pitch_fill(element, palette):
+    """Fill of a pitch coloured element, from its fill attribute or pitch class"""
+    for class_name in (element.get("class") or "").split():
+        if class_name in palette:
+            return palette[class_name]
+
+    return element.get("fill")
+
+
+def symbol_fills(svg):
+    """Fill colour of each symbol def (first filled shape), by id"""
+    fills = {}
+
+    for symbol in svg.find_all("symbol"):
+        shape = symbol.find(attrs={"fill": True})
+        fills[symbol.get("id")] = shape.get("fill") if shape else None
+
+    return fills
+
+
+def note_features(svg_markup):
+    """Semantic features of each note in a page SVG, keyed by note id"""
+    svg = BeautifulSoup(svg_markup, "xml")
+    fills = symbol_fills(svg)
+    palette = palette_fills(svg)
+    features = {}
+
+    for note in svg.find_all("g", class_="note"):
+        label = note.find("title", class_="labelAttr")
+        notehead = note.find("g", class_="notehead")
+        stem = note.find("g", class_="stem")
+
+        href = fill = order = None
+
+        if notehead:
+            use = notehead.find("use")
+            href = use.get("xlink:href") or use.get("href") if use else None
+            fill = pitch_fill(use, palette) if use else None
+            fill = fill or notehead.get("fill") or fills.get((href or "").lstrip("#"))
+
+            if stem:
+                children = [child for child in note.children if child.name]
+                order = "stem-first" if children.index(stem) < children.index(notehead) else "notehead-first"
+        else:
+            # Tablature, coloured shape drawn behind the fret number
+            shape = note.find(["rect", "circle"])
+            if shape:
+                href = shape.name
+                fill = pitch_fill(shape, palette)
+
+        features[note.get("id")] = {
+            "label": label.get_text() if label else None,
+            "symbol": normalize_href(href),
+            "fill": fill.lower() if fill else None,
+            "order": order,
+        }
+
+    return features
+
+
+def diff_pages(baseline_pages, candidate_pages):
+    """Human readable divergences between two engines' pages"""
+    diffs = []
+
+    if len(baseline_pages) != len(candidate_pages):
+        diffs.append(f"page count {len(baseline_pages)} != {len(candidate_pages)}")
+
+    for page, (baseline_svg, candidate_svg) in enumerate(zip(baseline_pages, candidate_pages), start=1):
+        baseline_notes = note_features(baseline_svg)
+        candidate_notes = note_features(candidate_svg)
+
+        for note_id in baseline_notes.keys() - candidate_notes.keys():
+            diffs.append(f"page {page} note {note_id}: missing from candidate")
+
+        for note_id in candidate_notes.keys() - baseline_notes.keys():
+            diffs.append(f"page {page} note {note_id}: only in candidate")
+
+        for note_id in baseline_notes.keys() & candidate_notes.keys():
+            for feature, baseline_value in baseline_notes[note_id].items():
+                candidate_value = candidate_notes[note_id][feature]
+
+                if baseline_value != candidate_value:
+                    diffs.append(f"page {page} note {note_id}: {feature} {baseline_value!r} != {candidate_value!r}")
+
+    return sorted(diffs)
+
+
+def collect_scores(mei_paths, synthetic_measures=None):
+    """Corpus scores plus any extra .mei files/directories and generated scores, [(name, mei_data)]"""
+    scores = load_scores(load_corpus())
+
+    for path in mei_paths or []:
+        paths = sorted(glob.glob(os.path.join(path, "*.mei"))) if os.path.isdir(path) else [path]
+
+        for mei_path in paths:
+            with open(mei_path, encoding="utf-8") as f:
+                scores.append((os.path.splitext(os.path.basename(mei_path))[0], f.read()))
+
+    return scores + synthetic_scores(synthetic_measures or [])
+
+
+def run_diff(baseline_engine, candidate_engine, scores):
+    """Compare engines over scores, prints divergences and returns the number of divergent scores"""
+    divergent = 0
+
+    for name, mei_data in scores:
+        diffs = diff_pages(baseline_engine(mei_data), candidate_engine(mei_data))
+
+        if not diffs:
+            print(f"OK    {name}")
+            continue
+
+        divergent += 1
+        print(f"DIFF  {name}: {len(diffs)} divergences")
+
+        for diff in diffs[:MAX_DIFFS_PER_SCORE]:
+            print(f"      {diff}")
+
+        if len(diffs) > MAX_DIFFS_PER_SCORE:
+            print(f"      ... {len(diffs) - MAX_DIFFS_PER_SCORE} more")
+
+    return divergent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two renderer engines note by note over the corpus")
+    parser.add_argument("--baseline", default=REFERENCE_ENGINE, help="Engine as module:function")
+    parser.add_argument("--candidate", default=REFERENCE_ENGINE, help="Engine as module:function")
+    parser.add_argument("--mei", nargs="*", help="Extra .mei files or directories to include")
+    parser.add_argument("--synthetic", nargs="*", type=int, help="Also diff generated scores with these measure counts")
+    args = parser.parse_args()
+
+    scores = collect_scores(args.mei, args.synthetic)
+    divergent = run_diff(load_engine(args.baseline), load_engine(args.candidate), scores)
+
+    if divergent:
+        print(f"\n{divergent} score(s) diverged")
+        sys.exit(1)
+
+    print("\nNo divergences")
+
+
+if __name__ == "__main__":
+    main()
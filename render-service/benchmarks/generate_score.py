@@ -0,0 +1,198 @@
+"""Generate synthetic MEI scores of controllable size and density for scaling tests.
+
+Usage (from render-service/):
+    python benchmarks/generate_score.py --measures 400 --staves 6 --chords-per-beat 2 -o big.mei
+    python benchmarks/generate_score.py --measures 64 --tab-staves 1 --tie-density 0.3 \\
+        --key-change-every 8 --non-numeric-every 5 -o guitar.mei
+"""
+# Standard Libraries
+import argparse
+import random
+from xml.sax.saxutils import escape
+
+PNAMES = ["c", "d", "e", "f", "g", "a", "b", ]
+ACCIDS = ["s", "f", "n", ]
+KEY_SIGS = ["0", "1s", "2s", "3s", "4s", "1f", "2f", "3f", "4f", "5f", ]
+
+# Standard guitar tuning, course 1 is the highest string
+GUITAR_TUNING = [("e", 4), ("b", 3), ("g", 3), ("d", 3), ("a", 2), ("e", 2), ]
+
+BEATS_PER_MEASURE = 4
+
+
+class IdGenerator:
+    """Deterministic xml:ids (n1, n2, ...), so generated scores are stable across runs"""
+    def __init__(self, prefix="n"):
+        self.prefix = prefix
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return f"{self.prefix}{self.count}"
+
+
+def staff_def(n, tab):
+    if tab:
+        courses = "".join(
+            f'<course n="{course}" pname="{pname}" oct="{octave}"/>'
+            for course, (pname, octave) in enumerate(GUITAR_TUNING, start=1)
+        )
+
+        return (
+            f'<staffDef n="{n}" lines="6" notationtype="tab.guitar">'
+            f'<label>Guitar {n}</label><tuning>{courses}</tuning></staffDef>'
+        )
+
+    clef_shape, clef_line = ("G", "2") if n % 2 else ("F", "4")
+
+    return f'<staffDef n="{n}" lines="5" clef.shape="{clef_shape}" clef.line="{clef_line}"/>'
+
+
+def random_pitch(rng, staff_n):
+    """(pname, oct) in a range suited to the staff's clef"""
+    octave = rng.choice([4, 5]) if staff_n % 2 else rng.choice([2, 3])
+
+    return rng.choice(PNAMES), octave
+
+
+def note_markup(note_id, pname, octave, rng):
+    accid = ""
+    roll = rng.random()
+
+    if roll < 0.1:
+        accid = f' accid="{rng.choice(ACCIDS)}"'  # Visible accidental
+    elif roll < 0.15:
+        accid = f' accid.ges="{rng.choice(ACCIDS[:2])}"'  # Gestural (from key signature)
+
+    return f'<note xml:id="{note_id}" pname="{pname}" oct="{octave}"{accid}/>'
+
+
+def generate_mei(measures=32, staves=2, chords_per_beat=1, chord_size=3, tie_density=0.1, key_change_every=0,
+                 tab_staves=0, non_numeric_every=0, seed=0, title="Synthetic Score"):
+    """Generate MEI text.
+
+    measures/staves/chords_per_beat/chord_size control size and density, tie_density is the chance a chord
+    ties into the next one, key_change_every adds a key signature change every N measures, tab_staves adds
+    guitar tablature staves (with <tuning>) and non_numeric_every gives every Nth measure an "n" like "12a".
+    """
+    if chords_per_beat not in [1, 2, 4, 8]:
+        raise ValueError("chords_per_beat must be 1, 2, 4 or 8")
+
+    rng = random.Random(seed)
+    next_id = IdGenerator()
+    dur = 4 * chords_per_beat
+
+    total_staves = staves + tab_staves
+    staff_defs = "".join(staff_def(n, tab=n > staves) for n in range(1, total_staves + 1))
+
+    # Tied chords repeat their pitches in the next chord, per staff
+    pending_ties = {}
+
+    sections = []
+    for measure_num in range(1, measures + 1):
+        key_change = key_change_every and measure_num > 1 and (measure_num - 1) % key_change_every == 0
+
+        if key_change:
+            sections.append(f'<scoreDef><keySig sig="{rng.choice(KEY_SIGS)}"/></scoreDef>')
+
+        # Measures following a key change must stay numeric for the key signature lookup
+        if non_numeric_every and measure_num > 1 and measure_num % non_numeric_every == 0 and not key_change:
+            n_attr = f"{measure_num - 1}a"
+        else:
+            n_attr = str(measure_num)
+
+        staff_parts = []
+        ties = []
+
+        for staff_n in range(1, total_staves + 1):
+            events = []
+
+            for _ in range(BEATS_PER_MEASURE * chords_per_beat):
+                if staff_n > staves:
+                    course = rng.randint(1, len(GUITAR_TUNING))
+                    events.append(
+                        f'<tabGrp xml:id="{next_id()}" dur="{dur}">'
+                        f'<note xml:id="{next_id()}" tab.course="{course}" tab.fret="{rng.randint(0, 12)}"/></tabGrp>'
+                    )
+                    continue
+
+                pitches = pending_ties.pop(staff_n, None)
+                tied_from = None
+
+                if pitches:
+                    pitches, tied_from = pitches
+                else:
+                    pitches = sorted({random_pitch(rng, staff_n) for _ in range(chord_size)})
+
+                note_ids = [next_id() for _ in pitches]
+                notes = "".join(
+                    note_markup(note_id, pname, octave, rng) for note_id, (pname, octave) in zip(note_ids, pitches)
+                )
+
+                if tied_from:
+                    ties.extend(
+                        f'<tie xml:id="{next_id()}" startid="#{start_id}" endid="#{end_id}"/>'
+                        for start_id, end_id in zip(tied_from, note_ids)
+                    )
+
+                if rng.random() < tie_density:
+                    pending_ties[staff_n] = (pitches, note_ids)
+
+                events.append(f'<chord xml:id="{next_id()}" dur="{dur}">{notes}</chord>')
+
+            staff_parts.append(
+                f'<staff xml:id="{next_id()}" n="{staff_n}"><layer xml:id="{next_id()}" n="1">'
+                f'{"".join(events)}</layer></staff>'
+            )
+
+        sections.append(f'<measure xml:id="{next_id()}" n="{n_attr}">{"".join(staff_parts)}{"".join(ties)}</measure>')
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<mei xmlns="http://www.music-encoding.org/ns/mei" meiversion="5.0">'
+        f'<meiHead><fileDesc><titleStmt><title>{escape(title)}</title>'
+        '<respStmt><persName role="composer">ColorMusic Score Generator</persName></respStmt>'
+        '</titleStmt><pubStmt/></fileDesc></meiHead>'
+        '<music><body><mdiv><score>'
+        f'<scoreDef meter.count="{BEATS_PER_MEASURE}" meter.unit="4"><keySig sig="0"/>'
+        f'<staffGrp>{staff_defs}</staffGrp></scoreDef>'
+        f'<section>{"".join(sections)}</section>'
+        '</score></mdiv></body></music></mei>\n'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MEI score")
+    parser.add_argument("--measures", type=int, default=32)
+    parser.add_argument("--staves", type=int, default=2, help="Standard notation staves")
+    parser.add_argument("--chords-per-beat", type=int, default=1, choices=[1, 2, 4, 8])
+    parser.add_argument("--chord-size", type=int, default=3, help="Max notes per chord")
+    parser.add_argument("--tie-density", type=float, default=0.1, help="Chance a chord ties into the next (0-1)")
+    parser.add_argument("--key-change-every", type=int, default=0, help="Key signature change every N measures")
+    parser.add_argument("--tab-staves", type=int, default=0, help="Guitar tablature staves with <tuning>")
+    parser.add_argument("--non-numeric-every", type=int, default=0, help="Every Nth measure gets n like \"12a\"")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Output .mei path, default stdout")
+    args = parser.parse_args()
+
+    mei = generate_mei(
+        measures=args.measures,
+        staves=args.staves,
+        chords_per_beat=args.chords_per_beat,
+        chord_size=args.chord_size,
+        tie_density=args.tie_density,
+        key_change_every=args.key_change_every,
+        tab_staves=args.tab_staves,
+        non_numeric_every=args.non_numeric_every,
+        seed=args.seed,
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(mei)
+    else:
+        print(mei, end="")
+
+
+if __name__ == "__main__":
+    main()
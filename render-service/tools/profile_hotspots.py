@@ -0,0 +1,67 @@
+"""Print the top hotspots of a profiled render.
+
+Usage:
+    python tools/profile_hotspots.py <render_id> --bucket <bucket_name> [--top 25] [--sort cumulative]
+    python tools/profile_hotspots.py --pstats path/to/render.pstats [--top 25] [--sort tottime]
+
+Renders are profiled when requested with the X-ColorMusic-Profile: 1 header (or "profile": true), or when
+sampled via PROFILE_SAMPLE_RATE.  The profile is stored under {render_id}/profile/.
+"""
+# Standard Libraries
+import argparse
+import json
+import os
+import pstats
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.profiling import PROFILE_PSTATS_FILENAME, PROFILE_STAGES_FILENAME
+
+
+def download_profile(bucket_name, render_id, directory):
+    """Download the pstats dump and stage timings for a render, returns (pstats_path, stages)"""
+    from google.cloud import storage
+
+    bucket = storage.Client().bucket(bucket_name)
+
+    pstats_path = os.path.join(directory, "render.pstats")
+    bucket.blob(f"{render_id}/{PROFILE_PSTATS_FILENAME}").download_to_filename(pstats_path)
+
+    stages = json.loads(bucket.blob(f"{render_id}/{PROFILE_STAGES_FILENAME}").download_as_text())
+
+    return pstats_path, stages
+
+
+def print_hotspots(pstats_path, sort, top, stages=None):
+    if stages:
+        print("Stage timings (ms):")
+        for name, stage in stages.items():
+            print(f"  {name:<16} total={stage['total_ms']:>10.2f}  count={stage['count']:>4}  max={stage['max_ms']:>10.2f}")
+        print()
+
+    pstats.Stats(pstats_path).strip_dirs().sort_stats(sort).print_stats(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the top hotspots of a profiled render")
+    parser.add_argument("render_id", nargs="?", help="Render id of a profiled render")
+    parser.add_argument("--bucket", default="colormusic-notation-tool-render-staging", help="Bucket holding the render")
+    parser.add_argument("--pstats", help="Local pstats file instead of downloading from the bucket")
+    parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"])
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    if args.pstats:
+        print_hotspots(args.pstats, args.sort, args.top)
+    elif args.render_id:
+        with tempfile.TemporaryDirectory() as directory:
+            pstats_path, stages = download_profile(args.bucket, args.render_id, directory)
+            print_hotspots(pstats_path, args.sort, args.top, stages=stages)
+    else:
+        parser.error("render_id or --pstats is required")
+
+
+if __name__ == "__main__":
+    main()